@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+BACKUP_INTERVAL = 30 * 60  # seconds between scheduled backups
+BACKUP_KEEP = 10  # newest snapshots kept, older ones are removed
+BACKUP_MAX_AGE = 30 * 24 * 60 * 60  # seconds after which a snapshot is removed, 0 keeps them
+BACKUP_STEP_PAGES = 64  # database pages copied per step
+BACKUP_STEP_SLEEP = 0.005  # seconds to let writers in between two steps
+BACKUP_MAX_RESTARTS = 3  # restarts caused by writes before the rest is copied in one step
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class LibraryBackup:
+    '''
+    Takes snapshots of a database with the sqlite online backup API on a thread of its own.
+    The database is copied a few pages at a time, so the application keeps reading and writing
+    it meanwhile. sqlite restarts the copy if another connection writes to the database during
+    it, so every snapshot is consistent. If it has to restart more than BACKUP_MAX_RESTARTS
+    times, the database is copied in a single step instead, which keeps writers waiting on
+    their busy timeout for as long as that takes.
+
+    Snapshots are named after the database and the time they were taken, and kept in
+    backup_directory. After each backup, snapshots beyond the newest keep and ones older than
+    max_age seconds are removed. schedule() takes a backup every interval seconds using after().
+    '''
+
+    _instances = []
+
+    def __init__(self, sqlite_db_path: str, backup_directory: Optional[str] = None,
+            interval: float = BACKUP_INTERVAL, keep: int = BACKUP_KEEP,
+            max_age: float = BACKUP_MAX_AGE):
+        self.sqlite_db_path = os.path.abspath(sqlite_db_path)
+        if backup_directory is None:
+            backup_directory = os.path.join(os.path.dirname(self.sqlite_db_path), 'backups')
+        self.backup_directory = backup_directory
+        self.interval = interval
+        self.keep = keep
+        self.max_age = max_age
+
+        self.progress = (0, 0)  # (remaining, total) pages of the running backup
+        self.last_snapshot = None
+        self.last_duration = None  # seconds the last successful backup took
+        self.last_error = None
+
+        self._thread = None
+        self._widget = None
+        self._after_id = None
+        LibraryBackup._instances.append(self)
+
+    @property
+    def _stem(self) -> str:
+        return os.path.splitext(os.path.basename(self.sqlite_db_path))[0]
+
+    def snapshots(self) -> List[str]:
+        ''' Returns the paths of the snapshots of the database, oldest first. '''
+
+        if not os.path.isdir(self.backup_directory):
+            return []
+        prefix, extension = self._stem + '-', os.path.splitext(self.sqlite_db_path)[1]
+        # The timestamp in the names sorts them by time
+        return [os.path.join(self.backup_directory, name)
+            for name in sorted(os.listdir(self.backup_directory))
+            if name.startswith(prefix) and name.endswith(extension)
+                and not name.endswith('.partial')]
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def backup_now(self) -> Future:
+        '''
+        Starts a backup unless one is running already. Returns a future of the snapshot's path,
+        or of the running backup's if there is one.
+        '''
+
+        if self.running():
+            return self._future
+        self._future = Future()
+        self._thread = threading.Thread(target=self._run, args=(self._future, ),
+            name='library-backup', daemon=True)
+        self._thread.start()
+        return self._future
+
+    def _run(self, future: Future) -> None:
+        started = time.perf_counter()
+        self.progress = (0, 0)
+        self._restarts = -1  # the first step always 'restarts' from 0 remaining
+        snapshot = os.path.join(self.backup_directory, '{}-{}{}'.format(self._stem,
+            time.strftime(SNAPSHOT_TIME_FORMAT), os.path.splitext(self.sqlite_db_path)[1]))
+        partial = snapshot + '.partial'
+        try:
+            os.makedirs(self.backup_directory, exist_ok=True)
+            source = sqlite3.connect(self.sqlite_db_path)
+            target = sqlite3.connect(partial)
+            try:
+                try:
+                    source.backup(target, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP,
+                        progress=self._step_done)
+                except _TooManyRestarts:
+                    source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            # Only complete snapshots ever get the name of one
+            os.replace(partial, snapshot)
+            self.prune()
+        except BaseException as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            self.last_error = e
+            print('Backup of {} failed: {}'.format(self.sqlite_db_path, e), file=sys.stderr)
+            future.set_exception(e)
+        else:
+            self.last_snapshot = snapshot
+            self.last_duration = time.perf_counter() - started
+            self.last_error = None
+            future.set_result(snapshot)
+
+    def _step_done(self, status: int, remaining: int, total: int) -> None:
+        if remaining > self.progress[0]:  # another connection wrote, the copy starts over
+            self._restarts += 1
+            if self._restarts > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        self.progress = (remaining, total)
+
+    def prune(self) -> None:
+        ''' Removes the snapshots beyond the newest keep and the ones older than max_age. '''
+
+        snapshots = self.snapshots()
+        expired = snapshots[:max(0, len(snapshots) - self.keep)] if self.keep else []
+        if self.max_age:
+            oldest = time.time() - self.max_age
+            expired += [snapshot for snapshot in snapshots[len(expired):]
+                if os.path.getmtime(snapshot) < oldest]
+        for snapshot in expired:
+            os.remove(snapshot)
+
+    def schedule(self, widget) -> None:
+        ''' Takes a backup every interval seconds, using the after() of a Tk widget. '''
+
+        self._widget = widget
+        self._after_id = widget.after(int(self.interval * 1000), self._scheduled)
+
+    def _scheduled(self) -> None:
+        self.backup_now()
+        self.schedule(self._widget)
+
+    def close(self) -> None:
+        ''' Stops scheduling backups and waits for a running one to finish. '''
+
+        if self._after_id is not None:
+            try:
+                self._widget.after_cancel(self._after_id)
+            except Exception:  # the widget is destroyed already
+                pass
+            self._after_id = None
+        if self._thread is not None:
+            self._thread.join()
+        if self in LibraryBackup._instances:
+            LibraryBackup._instances.remove(self)
+
+    @classmethod
+    def close_all(cls) -> None:
+        ''' Finishes every running backup. Call it when the application exits. '''
+
+        for backup in list(cls._instances):
+            backup.close()
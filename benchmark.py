@@ -0,0 +1,779 @@
+#! /usr/bin/env python3
+
+'''
+Benchmarks for Eliq. Every benchmark writes into a scratch directory that is removed afterwards.
+Run `python benchmark.py --help` to see the available benchmarks and options.
+'''
+
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import tempfile
+import random
+import argparse
+import itertools
+import subprocess
+from contextlib import contextmanager
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Iterator, List, Optional
+
+import fludo
+
+from storage import (ObjectStorage, AsyncObjectStorage, PickleCodec, StoredObjectDict,
+    connection_registry)
+from mixture_storage import MixtureCodec, MixtureStorage
+from mixture_snapshot import MixtureSnapshot
+from mixture_model import MixtureModel
+from mixture_batch import MixtureBatch
+from mixture_solver import solve_mixture
+from library_ui import LibraryUI
+from mixer import Mixer, CONTAINER_MAX, MAX_INGREDIENTS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+SCALE_SIZES = [1000, 10000, 100000, 1000000]
+SCALE_TABLE = 'mixtures'
+GENERATE_BATCH = 10000  # mixtures stored per commit when generating a library
+OPEN_REPEATS = 1000  # opens timed per mixture_open result, the mean is reported
+EDIT_REPEATS = 10000  # volume changes timed per mixture_model result, the mean is reported
+SOLVE_REPEATS = 200  # targets solved per mixture_solver result, the mean is reported
+MIXER_OPEN_REPEATS = 10  # mixtures opened per mixer_open result, the mean is reported
+RESIZE_REPEATS = 50  # bottle resizes per mixer_resize result, the mean is reported
+DRAG_STEPS = 500  # scale positions per mixer_drag result
+DRAG_STEPS_PER_FRAME = 10  # scale positions Tk gets before it's idle, like a fast drag
+
+benchmarks = dict()
+benchmark_sizes = dict()
+scale_phases = dict()
+
+
+def benchmark(name: str, sizes: List[int] = DEFAULT_SIZES) -> Callable:
+    '''
+    Registers the decorated function as a benchmark that can be selected by name.
+    It runs with sizes unless other sizes are given on the command line.
+    '''
+
+    def register(function: Callable) -> Callable:
+        benchmarks[name] = function
+        benchmark_sizes[name] = sizes
+        return function
+    return register
+
+
+def scale_phase(name: str, gui: bool = False) -> Callable:
+    '''
+    Registers the decorated function as a phase of the library_scale benchmark. A phase is
+    called with a Tk root (None unless gui is set), the path of a generated library and its size,
+    and returns the seconds it measured.
+    '''
+
+    def register(function: Callable) -> Callable:
+        scale_phases[name] = (function, gui)
+        return function
+    return register
+
+
+def timed(function: Callable, *args, **kwargs) -> float:
+    ''' Returns the wall clock seconds it took to call function. '''
+
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def scratch_db(workdir: str, name: str) -> str:
+    ''' Returns the path of a database file in workdir that doesn't exist yet. '''
+
+    path = os.path.join(workdir, '{}.sqlite3'.format(name))
+    connection_registry.close(path)
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+
+def sample_objects(count: int) -> list:
+    ''' Returns count (tag, object) pairs resembling stored mixtures. '''
+
+    return [('object-{}'.format(idx), {
+        'name': 'Mixture {}'.format(idx),
+        'notes': 'Steep for {} days.'.format(idx % 14),
+        'bottle_vol': 100,
+        'filler_idx': None,
+        'ingredients': [],
+    }) for idx in range(count)]
+
+
+def sample_mixture(idx: int) -> dict:
+    ''' Returns a Mixer dump that is always the same for the same idx. '''
+
+    generator = random.Random(idx)
+    ingredients = [
+        fludo.Liquid(name='Aroma {}'.format(generator.randint(1, 500)), pg=100.0, vg=0.0,
+            ml=float(generator.randint(1, 8)), cost_per_ml=0.5)
+        for aroma in range(generator.randint(1, 6))]
+    ingredients.append(fludo.Liquid(name='Nic shot 20mg', pg=50.0, vg=50.0, nic=20.0,
+        ml=float(generator.randint(0, 30)), cost_per_ml=0.2))
+    ingredients.append(fludo.Liquid(name='VG 100%', pg=0.0, vg=100.0, cost_per_ml=0.05,
+        ml=float(100 - sum(liquid.ml for liquid in ingredients))))
+    return {
+        'ingredients': ingredients,
+        'bottle_vol': 100,
+        'filler_idx': len(ingredients) - 1,
+        'name': 'Mixture {}'.format(idx),
+        'notes': 'Steep for {} days. '.format(idx % 14) * generator.choice([0, 1, 40]),
+    }
+
+
+def sample_mixture_with(ingredient_count: int) -> dict:
+    ''' Returns a Mixer dump of ingredient_count liquids that fills a 100 ml bottle. '''
+
+    ingredients = [fludo.Liquid(name='Aroma {}'.format(idx), pg=100.0, vg=0.0, ml=2.0,
+        cost_per_ml=0.5) for idx in range(ingredient_count - 1)]
+    ingredients.append(fludo.Liquid(name='VG 100%', pg=0.0, vg=100.0, cost_per_ml=0.05,
+        ml=float(100 - sum(liquid.ml for liquid in ingredients))))
+    return {
+        'ingredients': ingredients,
+        'bottle_vol': 100,
+        'filler_idx': len(ingredients) - 1,
+        'name': 'Mixture of {}'.format(ingredient_count),
+        'notes': 'Steep for a week.',
+    }
+
+
+@benchmark('storage_commits')
+def bench_storage_commits(sizes: List[int], workdir: str) -> List[dict]:
+    ''' Compares storing and deleting objects one commit per row with batched commits. '''
+
+    results = []
+    for size in sizes:
+        objects = sample_objects(size)
+        tags = [tag for tag, object_ in objects]
+
+        storage = ObjectStorage(scratch_db(workdir, 'per_row'), 'objects')
+        per_row_store = timed(lambda: [storage.store(tag, object_) for tag, object_ in objects])
+        per_row_delete = timed(lambda: [storage.delete(tag) for tag in tags])
+
+        storage = ObjectStorage(scratch_db(workdir, 'batched'), 'objects')
+        batched_store = timed(storage.store_many, objects)
+        batched_get = timed(storage.get_many, tags)
+        batched_delete = timed(storage.delete_many, tags)
+
+        results.append({
+            'size': size,
+            'per_row_store_s': per_row_store,
+            'per_row_delete_s': per_row_delete,
+            'batched_store_s': batched_store,
+            'batched_get_s': batched_get,
+            'batched_delete_s': batched_delete,
+        })
+    return results
+
+
+@benchmark('codec')
+def bench_codec(sizes: List[int], workdir: str) -> List[dict]:
+    ''' Compares the size and speed of MixtureCodec records with pickles of the same mixtures. '''
+
+    results = []
+    for size in sizes:
+        mixtures = [sample_mixture(idx) for idx in range(size)]
+        result = {'size': size}
+        for name, codec in [('pickle', PickleCodec()), ('record', MixtureCodec())]:
+            start = time.perf_counter()
+            encoded = [codec.encode(mixture) for mixture in mixtures]
+            encode_s = time.perf_counter() - start
+            decode_s = timed(lambda: [codec.decode(data) for data in encoded])
+            result.update({
+                '{}_bytes'.format(name): sum(len(data) for data in encoded),
+                '{}_encode_per_s'.format(name): size / encode_s,
+                '{}_decode_per_s'.format(name): size / decode_s,
+            })
+        results.append(result)
+    return results
+
+
+@benchmark('async_writes')
+def bench_async_writes(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Measures how long the caller is blocked queueing saves on the background writer compared
+    with saving directly, and the queue to done latency of the queued saves.
+    '''
+
+    results = []
+    for size in sizes:
+        mixtures = [('mixture-{}'.format(idx), sample_mixture(idx)) for idx in range(size)]
+
+        storage = MixtureStorage(scratch_db(workdir, 'direct'), 'mixtures')
+        direct_s = timed(lambda: [storage.upsert(tag, mixture) for tag, mixture in mixtures])
+
+        writer = AsyncObjectStorage(MixtureStorage, scratch_db(workdir, 'queued'), 'mixtures')
+        start = time.perf_counter()
+        futures = [writer.upsert(tag, mixture) for tag, mixture in mixtures]
+        queued_s = time.perf_counter() - start
+        for future in futures:
+            future.result()
+        done_s = time.perf_counter() - start
+        writer.close()
+
+        latency = writer.latency.stats()
+        results.append({
+            'size': size,
+            'direct_blocking_s': direct_s,
+            'queued_blocking_s': queued_s,
+            'queued_done_s': done_s,
+            'latency_mean_ms': latency['mean_ms'],
+            'latency_p50_ms': writer.latency.percentile(50),
+            'latency_p99_ms': writer.latency.percentile(99),
+            'latency_max_ms': latency['max_ms'],
+        })
+    return results
+
+
+def generate_library(path: str, size: int) -> None:
+    ''' Stores size mixtures from sample_mixture into the library at path. '''
+
+    storage = MixtureStorage(path, SCALE_TABLE)
+    mixtures = (('mixture-{}'.format(idx), sample_mixture(idx)) for idx in range(size))
+    while True:
+        batch = list(itertools.islice(mixtures, GENERATE_BATCH))
+        if not batch:
+            break
+        storage.store_many(batch)
+    connection_registry.close(path)
+
+
+def library_ui_stub(root: tk.Tk, path: str) -> LibraryUI:
+    ''' Returns a LibraryUI with only the parts that refresh_mixture_list uses. '''
+
+    ui = LibraryUI.__new__(LibraryUI)
+    ui.library_db_file = path
+    ui.library_table_name = SCALE_TABLE
+    ui.search_text = tk.StringVar(root)
+    ui.treeview = ttk.Treeview(root)
+    ui.sort_column = None
+    ui.sort_descending = False
+    return ui
+
+
+def peak_rss_kb() -> Optional[int]:
+    ''' Returns the peak resident set size of this process in KiB, None if it's unknown. '''
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS
+
+
+@contextmanager
+def virtual_display() -> Iterator[Optional[str]]:
+    '''
+    Yields the X display the GUI phases should use: the current one, or one of an Xvfb server
+    that is started for the duration if there is none. Yields None if no display is available.
+    '''
+
+    if sys.platform in ('win32', 'darwin') or os.environ.get('DISPLAY'):
+        yield os.environ.get('DISPLAY', '')
+        return
+
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        yield None
+        return
+
+    number = next(number for number in itertools.count(99)
+        if not os.path.exists('/tmp/.X11-unix/X{}'.format(number)))
+    server = subprocess.Popen([xvfb, ':{}'.format(number), '-screen', '0', '1280x1024x24',
+        '-nolisten', 'tcp'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while (not os.path.exists('/tmp/.X11-unix/X{}'.format(number))
+                and server.poll() is None and time.monotonic() < deadline):
+            time.sleep(0.05)
+        yield ':{}'.format(number) if server.poll() is None else None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_scale_phase(name: str, path: str, size: int, display: Optional[str]) -> dict:
+    '''
+    Runs a library_scale phase in a new Python process, so every phase starts cold and reports
+    its own peak RSS. Returns the seconds and the peak RSS the phase reported.
+    '''
+
+    environment = dict(os.environ)
+    if display:
+        environment['DISPLAY'] = display
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--phase', name,
+        '--library', path, '--sizes', str(size)], env=environment, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main_phase(name: str, path: str, size: int) -> int:
+    ''' Runs a single library_scale phase in this process and prints its result as JSON. '''
+
+    function, gui = scale_phases[name]
+    root = None
+    if gui:
+        root = tk.Tk()
+        root.withdraw()
+    seconds = function(root, path, size)
+    print(json.dumps({'seconds': seconds, 'peak_rss_kb': peak_rss_kb()}))
+    return 0
+
+
+@scale_phase('cold_open')
+def phase_cold_open(root: None, path: str, size: int) -> float:
+    return timed(MixtureStorage, path, SCALE_TABLE)
+
+
+@scale_phase('get_all')
+def phase_get_all(root: None, path: str, size: int) -> float:
+    storage = MixtureStorage(path, SCALE_TABLE)
+    return timed(storage.get_all)
+
+
+@scale_phase('summaries')
+def phase_summaries(root: None, path: str, size: int) -> float:
+    storage = MixtureStorage(path, SCALE_TABLE)
+    return timed(storage.get_summaries)
+
+
+@scale_phase('save')
+def phase_save(root: None, path: str, size: int) -> float:
+    storage = MixtureStorage(path, SCALE_TABLE)
+    mixture = sample_mixture(size // 2)
+    mixture['name'] = 'Saved {}'.format(mixture['name'])
+    return timed(storage.upsert, 'mixture-{}'.format(size // 2), mixture)
+
+
+@scale_phase('refresh', gui=True)
+def phase_refresh(root: tk.Tk, path: str, size: int) -> float:
+    ui = library_ui_stub(root, path)
+    return timed(ui.refresh_mixture_list)
+
+
+@scale_phase('open', gui=True)
+def phase_open(root: tk.Tk, path: str, size: int) -> float:
+    ''' What Library.open_mixture does with an existing mixture. '''
+
+    storage = MixtureStorage(path, SCALE_TABLE)
+    return timed(lambda: Mixer(root).load(
+        MixtureSnapshot.of(storage.get('mixture-{}'.format(size // 2)))))
+
+
+@scale_phase('mixer_load', gui=True)
+def phase_mixer_load(root: tk.Tk, path: str, size: int) -> float:
+    mixer = Mixer(root)
+    mixture = MixtureStorage(path, SCALE_TABLE).get('mixture-{}'.format(size // 2))
+    return timed(mixer.load, mixture)
+
+
+@benchmark('library_scale', sizes=SCALE_SIZES)
+def bench_library_scale(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Generates a library of every size and runs each phase on it in a new process, reporting
+    the seconds and peak RSS of the phases. GUI phases run on the current display or under
+    Xvfb, and are reported as None if neither is available.
+    '''
+
+    results = []
+    with virtual_display() as display:
+        for size in sizes:
+            path = scratch_db(workdir, 'library_scale')
+            result = {'size': size, 'generate_s': timed(generate_library, path, size),
+                'library_bytes': os.path.getsize(path)}
+            for name, (function, gui) in scale_phases.items():
+                phase = dict(seconds=None, peak_rss_kb=None)
+                if display is not None or not gui:
+                    phase = run_scale_phase(name, path, size, display)
+                result['{}_s'.format(name)] = phase['seconds']
+                result['{}_peak_rss_kb'.format(name)] = phase['peak_rss_kb']
+            results.append(result)
+    return results
+
+
+@benchmark('batch_evaluate')
+def bench_batch_evaluate(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Compares working out the volume, PG, VG, nicotine and cost of size mixtures with a
+    fludo.Mixture each and with one MixtureBatch, and counts the mixtures they disagree on.
+    '''
+
+    results = []
+    for size in sizes:
+        mixtures = [sample_mixture(idx) for idx in range(size)]
+        fludo_rows, batch_rows = [], []
+
+        def each():
+            for mixture_dict in mixtures:
+                mixture = fludo.Mixture(*mixture_dict['ingredients'])
+                fludo_rows.append((mixture.ml, mixture.pg, mixture.vg, mixture.nic,
+                    mixture.get_cost()))
+
+        def batch():
+            batch_rows.extend(MixtureBatch.of_dicts(mixtures).rows())
+
+        results.append({
+            'size': size,
+            'fludo_s': timed(each),
+            'batch_s': timed(batch),
+            'mismatches': sum(row != batch_row for row, batch_row in zip(fludo_rows, batch_rows)),
+        })
+    return results
+
+
+@benchmark('mixture_solver', sizes=[5, 10, MAX_INGREDIENTS])
+def bench_mixture_solver(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Times solving random PG/VG targets for a mixture of size ingredients with a nicotine shot
+    and a filler, keeping the volume of its first ingredient, and reports the largest PG error
+    of the solved recipes.
+    '''
+
+    generator = random.Random(0)
+    results = []
+    # The fixed ingredient, the filler and the nicotine shot at least, and at most as many
+    # ingredients as a Mixer holds
+    for size in sorted({min(max(size, 3), MAX_INGREDIENTS) for size in sizes}):
+        liquids = MixtureSnapshot.of(sample_mixture_with(size - 1)).dump()['ingredients']
+        liquids.append(fludo.Liquid(name='Nic Shot', pg=50.0, vg=50.0, nic=20.0))
+        targets = [(pg, 100 - pg, generator.choice([0, 3, 6])) for pg in
+            (generator.randint(30, 70) for repeat in range(SOLVE_REPEATS))]
+        solved = []
+
+        def solve():
+            for pg, vg, nic in targets:
+                solved.append(solve_mixture(liquids, 100, pg, vg, nic, fixed={0: liquids[0].ml},
+                    filler_idx=size - 2))
+
+        results.append({
+            'size': size,
+            'solve_ms': timed(solve) / SOLVE_REPEATS * 1e3,
+            'max_pg_error': max(abs(mixture.pg - pg)
+                for mixture, (pg, vg, nic) in zip(solved, targets)),
+        })
+    return results
+
+
+@benchmark('mixture_open', sizes=[MAX_INGREDIENTS])
+def bench_mixture_open(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Compares what opening a cached mixture of size ingredients costs with a deep copy of it,
+    as before, and with a MixtureSnapshot: taking one for the BottleViewer, and taking one and
+    copying its liquids for the Mixer. With a display, opening it in a Mixer is timed as well.
+    '''
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    results = []
+    try:
+        for size in sizes:
+            mixture = sample_mixture_with(size)
+            result = {'size': size}
+            for name, open_ in [('deepcopy', copy.deepcopy),
+                    ('snapshot_view', MixtureSnapshot.of),
+                    ('snapshot_edit', lambda mixture: MixtureSnapshot.of(mixture).dump())]:
+                result['{}_us'.format(name)] = timed(lambda: [open_(mixture)
+                    for repeat in range(OPEN_REPEATS)]) / OPEN_REPEATS * 1e6
+            for name, open_ in [('deepcopy', copy.deepcopy), ('snapshot', MixtureSnapshot.of)]:
+                seconds = None
+                if root is not None:
+                    mixer = Mixer(root)
+                    seconds = timed(lambda: mixer.load(open_(mixture)))
+                    mixer.toplevel.destroy()
+                result['mixer_{}_s'.format(name)] = seconds
+            results.append(result)
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+
+@benchmark('mixture_model', sizes=[2, 5, MAX_INGREDIENTS])
+def bench_mixture_model(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Compares what changing the volume of an ingredient costs in a mixture of size ingredients
+    with a filler: working the numbers out from a new fludo.Mixture of the liquids, as the Mixer
+    did on every change, and updating the running totals of a MixtureModel.
+    '''
+
+    results = []
+    for size in sizes:
+        mixture = MixtureSnapshot.of(sample_mixture_with(size)).dump()
+        volumes = [float(volume % 5 + 1) for volume in range(EDIT_REPEATS)]
+
+        liquids = mixture['ingredients']
+        def rebuild():
+            for volume in volumes:
+                liquids[0].update_ml(volume)
+                mixed = fludo.Mixture(*liquids)
+                mixed.ml, mixed.pg, mixed.vg, mixed.nic, mixed.get_cost()
+
+        model = MixtureModel(mixture['bottle_vol'])
+        for liquid in MixtureSnapshot.of(mixture).dump()['ingredients']:
+            model.add(liquid)
+        model.set_filler(len(model) - 1)
+        def incremental():
+            for volume in volumes:
+                model.set_ml(0, volume)
+                model.ml, model.pg, model.vg, model.nic, model.cost
+
+        results.append({
+            'size': size,
+            'mixture_us': timed(rebuild) / EDIT_REPEATS * 1e6,
+            'model_us': timed(incremental) / EDIT_REPEATS * 1e6,
+        })
+    return results
+
+
+@benchmark('mixer_open', sizes=[1, 5, MAX_INGREDIENTS])
+def bench_mixer_open(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Times opening a saved mixture of size ingredients until its Mixer is interactive, the way
+    the Library opens one: reading it from the library, loading a snapshot of it into a new
+    Mixer and letting Tk draw it and get idle. Reports how many updates loading ran as well.
+    Needs a display, the results are None without one.
+    '''
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    results = []
+    try:
+        for size in sizes:
+            result = {'size': size, 'open_s': None, 'load_updates': None}
+            if root is not None:
+                path = scratch_db(workdir, 'mixer_open')
+                MixtureStorage(path, SCALE_TABLE).store('mixture', sample_mixture_with(size))
+                connection_registry.close(path)
+                mixers = []
+
+                def open_():
+                    mixer = Mixer(root)
+                    mixer.load(MixtureSnapshot.of(
+                        MixtureStorage(path, SCALE_TABLE).get('mixture')))
+                    root.update()
+                    mixers.append(mixer)
+
+                result['open_s'] = sum(timed(open_)
+                    for repeat in range(MIXER_OPEN_REPEATS)) / MIXER_OPEN_REPEATS
+                result['load_updates'] = mixers[-1].updates_run
+                for mixer in mixers:
+                    mixer.toplevel.destroy()
+                connection_registry.close(path)
+            results.append(result)
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+
+@benchmark('mixer_drag', sizes=[MAX_INGREDIENTS])
+def bench_mixer_drag(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Drags the scale of the first ingredient of a Mixer with size ingredients and its
+    BottleViewer open, letting Tk get idle every DRAG_STEPS_PER_FRAME positions.
+    Reports the time per position and how many changes each update of the Mixer showed.
+    Needs a display, the results are None without one.
+    '''
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    results = []
+    try:
+        for size in sizes:
+            result = {'size': size, 'step_us': None, 'updates': None, 'changes_per_update': None}
+            if root is not None:
+                mixer = Mixer(root)
+                mixer.load(MixtureSnapshot.of(sample_mixture_with(size)))
+                mixer.show_bottle_viewer()
+                root.update()
+                ingredient = mixer.get_ingredient(0)
+                updates_run = mixer.updates_run
+
+                def drag():
+                    for step in range(DRAG_STEPS):
+                        ingredient.ml_scale.set(1 + step % 40 / 10)
+                        if not (step + 1) % DRAG_STEPS_PER_FRAME:
+                            root.update_idletasks()
+                    root.update_idletasks()
+
+                result['step_us'] = timed(drag) / DRAG_STEPS * 1e6
+                result['updates'] = mixer.updates_run - updates_run
+                result['changes_per_update'] = DRAG_STEPS / result['updates']
+                mixer.close_bottle_viewer()
+                mixer.cancel_update()
+                mixer.toplevel.destroy()
+            results.append(result)
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+
+@benchmark('mixer_resize', sizes=[MAX_INGREDIENTS])
+def bench_mixer_resize(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Resizes the bottle of a Mixer with size ingredients and its BottleViewer open between
+    100 ml and the largest bottle, and reports the time per resize and the changes passed on
+    and updates run by each. Needs a display, the results are None without one.
+    '''
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    results = []
+    try:
+        for size in sizes:
+            result = {'size': size, 'resize_ms': None, 'changes_per_resize': None,
+                'updates_per_resize': None}
+            if root is not None:
+                mixer = Mixer(root)
+                mixer.load(MixtureSnapshot.of(sample_mixture_with(size)))
+                mixer.show_bottle_viewer()
+                root.update()
+                update_events, updates_run = mixer.update_events, mixer.updates_run
+
+                def resize():
+                    for repeat in range(RESIZE_REPEATS):
+                        mixer.set_bottle_volume(CONTAINER_MAX if repeat % 2 else 100)
+                        root.update_idletasks()
+
+                result['resize_ms'] = timed(resize) / RESIZE_REPEATS * 1e3
+                result['changes_per_resize'] = \
+                    (mixer.update_events - update_events) / RESIZE_REPEATS
+                result['updates_per_resize'] = (mixer.updates_run - updates_run) / RESIZE_REPEATS
+                mixer.close_bottle_viewer()
+                mixer.toplevel.destroy()
+            results.append(result)
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+
+def tree_item_count(treeview: ttk.Treeview, item: str = '') -> int:
+    ''' Returns the number of items below item, at any depth. '''
+
+    children = treeview.get_children(item)
+    return len(children) + sum(tree_item_count(treeview, child) for child in children)
+
+
+def eager_refresh(ui: LibraryUI) -> None:
+    ''' Fills the first page of the Library list with every ingredient row, as it was before. '''
+
+    storage = MixtureStorage(ui.library_db_file, ui.library_table_name)
+    summaries = ui._get_page(storage)
+    ui.mixtures = StoredObjectDict(storage, [summary.tag for summary in summaries])
+    ui.treeview.delete(*ui.treeview.get_children())
+
+    for summary in summaries:
+        ui.treeview.insert('', tk.END, id=summary.tag, text=summary.name,
+            values=ui._mixture_values(summary))
+        ui._insert_ingredients(summary.tag)
+
+
+@benchmark('library_refresh')
+def bench_library_refresh(sizes: List[int], workdir: str) -> List[dict]:
+    '''
+    Compares the first page of the Library list with ingredient rows inserted on demand with
+    one that has the ingredient rows of every mixture inserted, as they were before.
+    Needs a display.
+    '''
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print('library_refresh skipped: {}'.format(e), file=sys.stderr)
+        return []
+    root.withdraw()
+
+    results = []
+    try:
+        for size in sizes:
+            ui = library_ui_stub(root, scratch_db(workdir, 'library'))
+            generate_library(ui.library_db_file, size)
+
+            # Eager first, while none of the mixtures it decodes are cached yet
+            eager_s = timed(eager_refresh, ui)
+            eager_items = tree_item_count(ui.treeview)
+            lazy_s = timed(ui.refresh_mixture_list)
+            lazy_items = tree_item_count(ui.treeview)
+            ui.treeview.destroy()
+
+            results.append({
+                'size': size,
+                'lazy_refresh_s': lazy_s,
+                'lazy_items': lazy_items,
+                'eager_refresh_s': eager_s,
+                'eager_items': eager_items,
+            })
+    finally:
+        root.destroy()
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+        help='benchmarks to run, one of: {} (default: all)'.format(', '.join(benchmarks)))
+    parser.add_argument('--sizes', nargs='+', type=int,
+        help='number of objects to benchmark with (default: {}, {} for library_scale)'.format(
+            DEFAULT_SIZES, SCALE_SIZES))
+    parser.add_argument('--json', metavar='PATH',
+        help='also write the results to PATH as JSON')
+    parser.add_argument('--phase', choices=list(scale_phases), help=argparse.SUPPRESS)
+    parser.add_argument('--library', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.phase:
+        return main_phase(args.phase, args.library, args.sizes[0])
+
+    unknown = [name for name in args.names if name not in benchmarks]
+    if unknown:
+        parser.error('unknown benchmark: {}'.format(', '.join(unknown)))
+
+    workdir = tempfile.mkdtemp(prefix='eliq-benchmark-')
+    report = dict()
+    try:
+        for name in args.names or list(benchmarks):
+            report[name] = benchmarks[name](args.sizes or benchmark_sizes[name], workdir)
+            for result in report[name]:
+                print(name, ', '.join('{}={}'.format(key,
+                    round(value, 4) if isinstance(value, float) else value)
+                    for key, value in result.items()))
+    finally:
+        connection_registry.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,11 @@
 # TODO: Decouple Tkinter from application logic
 
 from library import Library
+from storage import AsyncObjectStorage, connection_registry
+from backup import LibraryBackup
 
 app = Library()
 app.root.mainloop()
+AsyncObjectStorage.close_all()
+LibraryBackup.close_all()
+connection_registry.close_all()
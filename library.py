@@ -1,15 +1,14 @@
 import uuid
-import copy
 
 import tkinter as tk
-from tkinter import ttk
-
-import fludo
+from tkinter import ttk, messagebox
 
 from common import center_toplevel, round_digits, YesNoDialog
 from common_ui import CommonUI
 from library_ui import LibraryUI
-from storage import ObjectStorage
+from storage import StoredObjectDict
+from mixture_storage import MixtureStorage
+from mixture_snapshot import MixtureSnapshot
 from mixer import Mixer
 from viewer import BottleViewer
 from images import icons, set_icon
@@ -21,10 +20,12 @@ class Library:
         
         self.ui = ui
         self.ui.refresh_mixture_list()
+        self.ui.start_backups()
 
         self.mixer = mixer
         self.viewer = viewer
-        self.storage = storage
+        self.storage = storage  # AsyncObjectStorage, writes finish in the background
+        self.storage.add_listener(self.ui.mixture_changed)
 
         self.mixtures = {}  # mixer dumps
         self.opened_mixers = {}  # mixer instances
@@ -36,12 +37,25 @@ class Library:
         else:
             self.ui.close()
     
+    def _write_done(self, future, parent=None) -> bool:
+        ''' Shows the error of a failed write to the user. Returns whether the write succeeded. '''
+
+        exception = future.exception()
+        if exception is not None:
+            messagebox.showerror('Eliq', str(exception), parent=parent or self.ui.toplevel)
+            return False
+        return True
+    
     def save_mixture_callback(self, mixture_dict, mixture_identifier):
-        self.storage.delete(mixture_identifier)
-        self.storage.store(mixture_identifier, mixture_dict)
-        self.close_window(mixture_identifier, self.opened_mixers)
+        # The Mixer is closed once the mixture is committed, and stays open if saving fails
+        mixer = self.opened_mixers[mixture_identifier]
 
-        self.ui.refresh_mixture_list()
+        def saved(future):
+            if (self._write_done(future, mixer.toplevel) and
+                    self.opened_mixers.get(mixture_identifier) is mixer):
+                self.close_window(mixture_identifier, self.opened_mixers)
+
+        self.storage.upsert(mixture_identifier, mixture_dict, callback=saved)
     
     def show_remove_dialog(self, mixture_identifier) -> None:
         ''' Asks the user if they are sure to remove the mixture from the Library. '''
@@ -55,28 +69,27 @@ class Library:
                     self.delete_mixture(mixture_identifier if ok_clicked else None))
 
     def delete_mixture(self, mixture_identifier):
+        # Its windows are closed once the deletion is committed
+        def deleted(future):
+            if self._write_done(future):
+                if mixture_identifier in self.opened_mixers:
+                    self.close_window(mixture_identifier, self.opened_mixers)
+                if mixture_identifier in self.opened_viewers:
+                    self.close_window(mixture_identifier, self.opened_viewers)
+
         if mixture_identifier is not None:
-            self.storage.delete(mixture_identifier)
-        
-        if mixture_identifier in self.opened_mixers:
-            self.close_window(mixture_identifier, self.opened_mixers)
-        if mixture_identifier in self.opened_viewers:
-            self.close_window(mixture_identifier, self.opened_viewers)
-        
-        self.ui.refresh_mixture_list()
+            self.storage.delete(mixture_identifier, callback=deleted)
     
     def duplicate_mixture(self, mixture_identifier):
-        # TODO: Create mixer dump manipulators
-        self.mixer.set_dump_property(self.mixtures[mixture_identifier],
-            name='Copy of {}'.format(
-                self.mixer.get_dump_property(self.mixtures[mixture_identifier], 'name')))
-
-        self.storage.store(str(uuid.uuid4()), self.mixtures[mixture_identifier])
-
-        self.ui.refresh_mixture_list()
+        # Copied within the database, only the name of the copy is written
+        self.storage.copy(mixture_identifier, str(uuid.uuid4()), {'name': 'Copy of {}'.format(
+            self.ui.treeview.item(mixture_identifier, 'text'))}, callback=self._write_done)
     
     def close_window(self, window_key, opened_windows_dict):
         # TODO: Replace with .ui.close() when Mixer is decoupled
+        if opened_windows_dict is self.opened_mixers:
+            # An update still pending from a scale drag would run on the destroyed widgets
+            opened_windows_dict[window_key].cancel_update()
         opened_windows_dict[window_key].toplevel.destroy()
         del opened_windows_dict[window_key]
     
@@ -92,7 +105,7 @@ class Library:
                     discard_callback_args=[mixture_identifier, self.opened_mixers])
                 if not create_new:  # Load existing
                     self.opened_mixers[mixture_identifier].load(
-                        copy.deepcopy(self.mixtures[mixture_identifier]))
+                        MixtureSnapshot.of(self.mixtures[mixture_identifier]))
                 
                 # TODO: Replace with .ui.on_close_callback() once Mixer is decoupled
                 self.opened_mixers[mixture_identifier].toplevel.protocol('WM_DELETE_WINDOW',
@@ -112,11 +125,11 @@ class Library:
             if mixture_identifier in self.mixtures:
                 if mixture_identifier not in self.opened_viewers:
                     viewer = self.viewer(self.toplevel)
-                    mixture = copy.deepcopy(self.mixtures[mixture_identifier])
-                    viewer.set_name(mixture['name'])
-                    viewer.set_bottle_size(mixture['bottle_vol'])
-                    viewer.set_ingredients(mixture['ingredients'])
-                    viewer.set_notes(mixture['notes'])
+                    mixture = MixtureSnapshot.of(self.mixtures[mixture_identifier])
+                    viewer.set_name(mixture.name)
+                    viewer.set_bottle_size(mixture.bottle_vol)
+                    viewer.set_ingredients(mixture.ingredients)
+                    viewer.set_notes(mixture.notes)
                     self.opened_viewers[mixture_identifier] = viewer
                     self.opened_viewers[mixture_identifier].toplevel.protocol('WM_DELETE_WINDOW',
                         lambda: self.close_window(mixture_identifier, self.opened_viewers))
@@ -133,19 +146,35 @@ class Library:
         return 'break'
     
     def reload_treeview(self) -> None:
-        self.mixtures = ObjectStorage(self.library_db_file, self.library_table_name).get_all()
+        storage = MixtureStorage(self.library_db_file, self.library_table_name)
+        summaries = storage.get_summaries()
+        self.mixtures = StoredObjectDict(storage, [summary.tag for summary in summaries])
         self.treeview.delete(*self.treeview.get_children())
+        # Replaces the previous binding, ingredients are only read when a mixture is opened
+        self.treeview.bind('<<TreeviewOpen>>',
+            lambda event: self.expand_mixture(self.treeview.focus()))
 
-        for mixture_identifier in self.mixtures:
-            mixture = fludo.Mixture(*self.mixtures[mixture_identifier]['ingredients'])
-            mx_id = self.treeview.insert('', tk.END, id=mixture_identifier,
-                text=self.mixtures[mixture_identifier]['name'],
+        for summary in summaries:
+            self.treeview.insert('', tk.END, id=summary.tag, text=summary.name,
                 values=(
-                    '{} / {}'.format(int(mixture.pg), int(mixture.vg)),
-                    '{} mg'.format(round_digits(mixture.nic, 1)),
-                    '{} ml'.format(round_digits(mixture.ml, 1))))
+                    '{} / {}'.format(int(summary.pg), int(summary.vg)),
+                    '{} mg'.format(round_digits(summary.nic, 1)),
+                    '{} ml'.format(round_digits(summary.ml, 1))))
+            if summary.ingredient_count:
+                # A single hidden child keeps the expand indicator until it's opened
+                self.treeview.insert(summary.tag, tk.END, tags=('placeholder'))
+    
+    def expand_mixture(self, mixture_identifier) -> None:
+        ''' Replaces the placeholder of a mixture that is being opened with its ingredients. '''
+
+        if mixture_identifier not in self.mixtures:
+            return  # an ingredient row
+        children = self.treeview.get_children(mixture_identifier)
+        if children and self.treeview.tag_has('placeholder', children[0]):
+            self.treeview.delete(*children)
             for liquid in self.mixtures[mixture_identifier]['ingredients']:
-                self.treeview.insert(mx_id, tk.END, text=liquid.name, tags=('ingredient'),
+                self.treeview.insert(mixture_identifier, tk.END, text=liquid.name,
+                    tags=('ingredient'),
                     values=(
                         '{} / {}'.format(int(liquid.pg), int(liquid.vg)),
                         '{} mg'.format(round_digits(liquid.nic, 1)),
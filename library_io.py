@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+
+'''
+Export and import of the mixture library as JSON Lines or CSV files.
+Mixtures are streamed one by one and imported in batches, so memory use doesn't grow with the
+size of the library. Run `python library_io.py --help` for the command line usage.
+'''
+
+import os
+import sys
+import csv
+import json
+import uuid
+import argparse
+import itertools
+from typing import Callable, Iterable, Iterator, Optional
+
+import fludo
+
+from storage import connection_registry
+from mixture_storage import MixtureStorage, LIQUID_FIELDS, liquid_class
+
+DEFAULT_TABLE = 'mixtures'
+IMPORT_BATCH = 1000  # mixtures stored per commit when importing
+PROGRESS_EVERY = 1000  # mixtures between two progress reports
+
+FORMATS = ('jsonl', 'csv')
+CSV_MIXTURE_COLUMNS = ('tag', 'name', 'bottle_vol', 'filler_idx', 'notes')
+CSV_LIQUID_COLUMNS = ('liquid_type', 'liquid_name', *LIQUID_FIELDS)
+
+
+def file_format(path: str) -> str:
+    ''' Guesses the format of a library file from its extension, JSON Lines if unknown. '''
+
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+
+
+def liquid_record(liquid: fludo.Liquid) -> dict:
+    record = {'type': type(liquid).__name__, 'name': liquid.name}
+    record.update((field, getattr(liquid, field)) for field in LIQUID_FIELDS)
+    return record
+
+
+def record_liquid(record: dict) -> fludo.Liquid:
+    ''' Returns the fludo liquid of a record made by liquid_record. '''
+
+    class_ = liquid_class(record.get('type', 'Liquid'))
+    # Like MixtureCodec.decode, without calling the __init__ of the fludo subclasses
+    liquid = class_.__new__(class_)
+    liquid.__dict__.update(name=record['name'], pg=record['pg'], vg=record['vg'],
+        nic=record['nic'], cost_per_ml=record['cost_per_ml'])
+    liquid.update_ml(record['ml'])
+    return liquid
+
+
+def mixture_record(tag: str, mixture_dict: dict) -> dict:
+    ''' Returns a Mixer dump as a dict of plain JSON types, with its tag. '''
+
+    return {
+        'tag': tag,
+        'name': mixture_dict['name'],
+        'bottle_vol': mixture_dict['bottle_vol'],
+        'filler_idx': mixture_dict['filler_idx'],
+        'notes': mixture_dict['notes'],
+        'ingredients': [liquid_record(liquid) for liquid in mixture_dict['ingredients']],
+    }
+
+
+def record_mixture(record: dict) -> tuple:
+    ''' Returns the (tag, Mixer dump) of a record made by mixture_record. '''
+
+    return record.get('tag') or str(uuid.uuid4()), {
+        'ingredients': [record_liquid(liquid) for liquid in record['ingredients']],
+        'bottle_vol': record['bottle_vol'],
+        'filler_idx': record['filler_idx'],
+        'name': record['name'],
+        'notes': record.get('notes', ''),
+    }
+
+
+def write_jsonl(records: Iterable[dict], f) -> None:
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n')
+
+
+def read_jsonl(f) -> Iterator[dict]:
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_csv(records: Iterable[dict], f) -> None:
+    '''
+    Writes one row per ingredient, repeating the mixture columns on each row.
+    A mixture without ingredients is written as one row with empty liquid columns.
+    '''
+
+    writer = csv.writer(f)
+    writer.writerow(CSV_MIXTURE_COLUMNS + CSV_LIQUID_COLUMNS)
+    for record in records:
+        mixture_row = [record[column] for column in CSV_MIXTURE_COLUMNS]
+        if mixture_row[3] is None:
+            mixture_row[3] = ''
+        if not record['ingredients']:
+            writer.writerow(mixture_row + [''] * len(CSV_LIQUID_COLUMNS))
+        for liquid in record['ingredients']:
+            writer.writerow(mixture_row + [liquid['type'], liquid['name']] +
+                [liquid[field] for field in LIQUID_FIELDS])
+
+
+def _number(text: str):
+    ''' Parses a number written by write_csv, keeping ints ints. '''
+
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def read_csv(f) -> Iterator[dict]:
+    ''' Yields the records of a file written by write_csv, joining the rows of each mixture. '''
+
+    for tag, rows in itertools.groupby(csv.DictReader(f), key=lambda row: row['tag']):
+        rows = list(rows)
+        yield {
+            'tag': tag,
+            'name': rows[0]['name'],
+            'bottle_vol': _number(rows[0]['bottle_vol']),
+            'filler_idx': int(rows[0]['filler_idx']) if rows[0]['filler_idx'] else None,
+            'notes': rows[0]['notes'],
+            'ingredients': [dict({'type': row['liquid_type'], 'name': row['liquid_name']},
+                **{field: _number(row[field]) for field in LIQUID_FIELDS})
+                for row in rows if row['liquid_type']],
+        }
+
+
+writers = {'jsonl': write_jsonl, 'csv': write_csv}
+readers = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def _reporting(items: Iterable, progress: Optional[Callable[[int], None]]) -> Iterator:
+    ''' Passes items through, calling progress with the count every PROGRESS_EVERY and at the end. '''
+
+    count = 0
+    for count, item in enumerate(items, 1):
+        if progress is not None and not count % PROGRESS_EVERY:
+            progress(count)
+        yield item
+    if progress is not None:
+        progress(count)
+
+
+def export_library(storage: MixtureStorage, path: str, format_: Optional[str] = None,
+        progress: Optional[Callable[[int], None]] = None) -> None:
+    '''
+    Writes every mixture of storage to path, streaming them from the database.
+    The format is guessed from the extension of path unless it's given.
+    progress(count) is called with the number of mixtures written so far.
+    '''
+
+    records = (mixture_record(tag, lazy_mixture.value) for tag, lazy_mixture in storage.iter_all())
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writers[format_ or file_format(path)](_reporting(records, progress), f)
+
+
+def import_library(storage: MixtureStorage, path: str, format_: Optional[str] = None,
+        progress: Optional[Callable[[int], None]] = None, batch_size: int = IMPORT_BATCH) -> None:
+    '''
+    Stores the mixtures of a file written by export_library, committing every batch_size of them.
+    Mixtures with a tag that is already in storage are replaced.
+    The format is guessed from the extension of path unless it's given.
+    progress(count) is called with the number of mixtures read so far.
+    '''
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        mixtures = (record_mixture(record) for record in
+            _reporting(readers[format_ or file_format(path)](f), progress))
+        while True:
+            batch = list(itertools.islice(mixtures, batch_size))
+            if not batch:
+                break
+            storage.upsert_many(batch)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('library', help='the library database file')
+    parser.add_argument('path', help='the file to export to or import from')
+    parser.add_argument('--table', default=DEFAULT_TABLE,
+        help='the table of the mixtures in the library (default: %(default)s)')
+    parser.add_argument('--format', choices=FORMATS, dest='format_',
+        help='format of the file (default: csv for .csv files, jsonl otherwise)')
+    args = parser.parse_args(argv)
+
+    def progress(count):
+        print('\r{} {} mixtures'.format(args.command.capitalize() + 'ed', count),
+            end='', file=sys.stderr, flush=True)
+
+    storage = MixtureStorage(args.library, args.table)
+    try:
+        if args.command == 'export':
+            export_library(storage, args.path, args.format_, progress)
+        else:
+            import_library(storage, args.path, args.format_, progress)
+    finally:
+        print(file=sys.stderr)
+        connection_registry.close_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
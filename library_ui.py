@@ -1,7 +1,28 @@
+import uuid
+import threading
+
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog, messagebox
 
+from common import round_digits, YesNoDialog
 from common_ui import CommonUI
+from storage import StoredObjectDict, AsyncObjectStorage, connection_registry
+from mixture_storage import MixtureStorage
+from mixture_snapshot import MixtureSnapshot
+import library_io
+from backup import LibraryBackup
+from mixer import Mixer
+from viewer import BottleViewer
+from images import icons, set_icon
+from version import VERSION
+
+SEARCH_DELAY = 150  # ms to wait after the last keystroke before filtering the list
+TRANSFER_POLL = 100  # ms between progress updates of an export or import
+LIBRARY_FILE_TYPES = [('JSON Lines', '*.jsonl'), ('CSV', '*.csv'), ('All files', '*')]
+SORT_COLUMNS = {'#0': 'name', 'pgvg': 'pg', 'nic': 'nic', 'ml': 'ml'}  # summary column of each
+PAGE_SIZE = 100  # mixtures loaded into the list at a time
+MAX_RESIDENT_PAGES = 5  # pages kept in the list, the farthest one is dropped to load another
+LOAD_MARGIN = 0.1  # fraction of the list from its ends where the next page gets loaded
 
 
 class LibraryUI:
@@ -12,7 +33,7 @@ class LibraryUI:
         self.toplevel.protocol('WM_DELETE_WINDOW', self.close_main_window)
         self.toplevel.withdraw()
 
-        self.toplevel.rowconfigure(1, weight=1)
+        self.toplevel.rowconfigure(2, weight=1)
         self.toplevel.columnconfigure(0, weight=1)
         
         self.toplevel.title('Eliq {} | Library'.format(VERSION))
@@ -44,43 +65,84 @@ class LibraryUI:
         self.view_button.grid(row=0, column=3)
 
         self.duplicate_button = ttk.Button(self.button_frame, text='Duplicate Selected', width=20,
-            command=lambda: self.duplicate_mixture(self.treeview.focus()))
+            command=lambda: self.duplicate_mixtures(self.treeview.selection()))
         set_icon(self.duplicate_button, icons['copy'])
         self.duplicate_button.grid(row=0, column=4)
 
+        self.export_button = ttk.Button(self.button_frame, text='Export...', width=10,
+            command=self.export_mixtures)
+        set_icon(self.export_button, icons['save'])
+        self.export_button.grid(row=0, column=5)
+
+        self.import_button = ttk.Button(self.button_frame, text='Import...', width=10,
+            command=self.import_mixtures)
+        set_icon(self.import_button, icons['file'])
+        self.import_button.grid(row=0, column=6)
+
+        self.search_frame = ttk.Frame(self.toplevel)
+        self.search_frame.columnconfigure(1, weight=1)
+        self.search_frame.grid(row=1, column=0, pady=3, sticky=tk.EW)
+
+        self.search_label = ttk.Label(self.search_frame, text='Search:')
+        self.search_label.grid(row=0, column=0, padx=5)
+
+        self.search_text = tk.StringVar()
+        self.search_text.trace_add('write', lambda var, idx, op: self._schedule_search())
+        self.search_entry = ttk.Entry(self.search_frame, textvariable=self.search_text)
+        self.search_entry.grid(row=0, column=1, padx=5, sticky=tk.EW)
+        self.search_entry.bind('<Escape>', lambda event: self.search_text.set(''))
+        self._search_after_id = None
+
+        self.transfer_label = ttk.Label(self.search_frame)
+        self.transfer_label.grid(row=0, column=2, padx=5)
+        self._transfer = None  # thread of a running export or import
+
         self.treeview_frame = ttk.Frame(self.toplevel)
         self.treeview_frame.columnconfigure(0, weight=1)
         self.treeview_frame.rowconfigure(0, weight=1)
-        self.treeview_frame.grid(column=0, row=1, sticky=tk.EW + tk.NS)
+        self.treeview_frame.grid(column=0, row=2, sticky=tk.EW + tk.NS)
 
         style = ttk.Style()
         style.configure('mystyle.Treeview', highlightthickness=0, border=0, font=('Calibri', 11))
         style.configure('mystyle.Treeview.Heading', font=('Calibri', 11, 'bold'))
         style.layout('mystyle.Treeview', [('mystyle.Treeview.treearea', {'sticky': 'nswe'})])
 
-        self.treeview = ttk.Treeview(self.treeview_frame, selectmode='browse',
+        self.treeview = ttk.Treeview(self.treeview_frame, selectmode='extended',
             style='mystyle.Treeview')
         self.treeview.configure(columns=('pgvg', 'nic', 'ml'))
         self.treeview.column('#0', width=350, anchor=tk.W)
         self.treeview.column('pgvg', width=90, stretch=False, anchor=tk.CENTER)
         self.treeview.column('nic', width=90, stretch=False, anchor=tk.CENTER)
         self.treeview.column('ml', width=70, stretch=False, anchor=tk.CENTER)
-        self.treeview.heading('#0', text='Mixture Name')
-        self.treeview.heading('pgvg', text='PG / VG %')
-        self.treeview.heading('nic', text='Nic. (mg/ml)')
-        self.treeview.heading('ml', text='Amount')
+        self.heading_texts = {
+            '#0': 'Mixture Name',
+            'pgvg': 'PG / VG %',
+            'nic': 'Nic. (mg/ml)',
+            'ml': 'Amount',
+        }
+        for column, text in self.heading_texts.items():
+            self.treeview.heading(column, text=text,
+                command=lambda column=column: self.sort_mixtures(column))
+        self.sort_column = None  # Treeview column the list is sorted by, None for stored order
+        self.sort_descending = False
+        self._more_before = False  # whether there are mixtures before the loaded pages
+        self._more_after = False
+        self._paging_scheduled = False
         self.treeview.tag_configure('ingredient', background='#ededed')
         self.treeview_vscroll = ttk.Scrollbar(self.treeview_frame, orient=tk.VERTICAL,
             command=self.treeview.yview)
-        self.treeview.configure(yscrollcommand=self.treeview_vscroll.set)
+        self.treeview.configure(yscrollcommand=self._treeview_scrolled)
         self.treeview.grid(row=0, column=0, sticky=tk.EW + tk.NS)
         self.treeview_vscroll.grid(row=0, column=1, sticky=tk.NS)
         self.treeview.bind('<Double-1>', self.open_wrapper)
         self.treeview.bind('<Return>', self.open_wrapper)
         self.treeview.bind('<Button-1>', self._inhibit_column_resize)
         self.treeview.bind('<Delete>', lambda event: self.show_remove_dialog(self.treeview.focus()))
+        self.treeview.bind('<<TreeviewOpen>>', lambda event: self.expand_mixture(self.treeview.focus()))
 
         self.close_dialog = None
+        self._storage_writer = None
+        self.backup = None
     
     def close_main_window(self):
         def close_if_ok_clicked(ok_clicked):
@@ -101,17 +163,111 @@ class LibraryUI:
         else:
             self.toplevel.destroy()
     
+    def start_backups(self) -> None:
+        ''' Backs up the library every BACKUP_INTERVAL while Eliq runs, see LibraryBackup. '''
+
+        if self.backup is None:
+            self.backup = LibraryBackup(self.library_db_file)
+            self.backup.schedule(self.toplevel)
+    
+    def _schedule_search(self):
+        ''' Filters the list when the user stops typing in the search entry for a moment. '''
+
+        if self._search_after_id is not None:
+            self.toplevel.after_cancel(self._search_after_id)
+        self._search_after_id = self.toplevel.after(SEARCH_DELAY, self._search)
+    
+    def _search(self):
+        self._search_after_id = None
+        self.refresh_mixture_list()
+    
+    def export_mixtures(self) -> None:
+        path = filedialog.asksaveasfilename(parent=self.toplevel, title='Export Library',
+            defaultextension='.jsonl', filetypes=LIBRARY_FILE_TYPES)
+        if path:
+            self._start_transfer(library_io.export_library, path, 'Exported')
+    
+    def import_mixtures(self) -> None:
+        path = filedialog.askopenfilename(parent=self.toplevel, title='Import Library',
+            filetypes=LIBRARY_FILE_TYPES)
+        if path:
+            self._start_transfer(library_io.import_library, path, 'Imported')
+    
+    def _start_transfer(self, function, path, verb) -> None:
+        '''
+        Runs library_io.export_library or import_library on a thread of its own, showing its
+        progress next to the search entry. Only one export or import runs at a time.
+        '''
+
+        if self._transfer is not None and self._transfer.is_alive():
+            return
+        self._transfer_count = 0
+        self._transfer_error = None
+
+        def run():
+            try:
+                function(MixtureStorage(self.library_db_file, self.library_table_name), path,
+                    progress=lambda count: setattr(self, '_transfer_count', count))
+            except Exception as e:  # shown on the Tk main thread by _poll_transfer
+                self._transfer_error = e
+            finally:
+                connection_registry.close(self.library_db_file)
+
+        self._transfer = threading.Thread(target=run, name='library-transfer', daemon=True)
+        self._transfer.start()
+        self._poll_transfer(verb)
+    
+    def _poll_transfer(self, verb) -> None:
+        self.transfer_label.configure(text='{} {} mixtures'.format(verb, self._transfer_count))
+        if self._transfer.is_alive():
+            self.toplevel.after(TRANSFER_POLL, self._poll_transfer, verb)
+            return
+
+        if self._transfer_error is not None:
+            self.transfer_label.configure(text='')
+            messagebox.showerror('Eliq', str(self._transfer_error), parent=self.toplevel)
+        if verb == 'Imported':
+            self.refresh_mixture_list()
+    
     def _inhibit_column_resize(self, event):
         if self.treeview.identify_region(event.x, event.y) == 'separator':
             # Return 'break' to not propagate the event to other bindings
             return 'break'
     
+    @property
+    def storage_writer(self) -> AsyncObjectStorage:
+        ''' Writes to the library on a background thread, so saving never freezes the UI. '''
+
+        if self._storage_writer is None:
+            self._storage_writer = AsyncObjectStorage(MixtureStorage,
+                self.library_db_file, self.library_table_name)
+            self._storage_writer.add_listener(self.mixture_changed)
+            self._storage_writer.deliver_to(self.toplevel)
+        return self._storage_writer
+    
+    def _write_done(self, future, parent=None) -> bool:
+        ''' Shows the error of a failed write to the user. Returns whether the write succeeded. '''
+
+        exception = future.exception()
+        if exception is not None:
+            messagebox.showerror('Eliq', str(exception), parent=parent or self.toplevel)
+            return False
+        return True
+    
     def save_mixture_callback(self, mixture_dict, mixture_identifier):
-        storage = ObjectStorage(self.library_db_file, self.library_table_name)
-        storage.delete(mixture_identifier)
-        storage.store(mixture_identifier, mixture_dict)
-        self.close_window(mixture_identifier, self.opened_mixers)
-        self.refresh_mixture_list()
+        '''
+        Saves the mixture on the background writer. Its Mixer is closed once the mixture is
+        committed, and stays open if saving fails, so the user can try again.
+        '''
+
+        mixer = self.opened_mixers[mixture_identifier]
+
+        def saved(future):
+            if (self._write_done(future, mixer.toplevel) and
+                    self.opened_mixers.get(mixture_identifier) is mixer):
+                self.close_window(mixture_identifier, self.opened_mixers)
+
+        self.storage_writer.upsert(mixture_identifier, mixture_dict, callback=saved)
     
     def show_remove_dialog(self, mixture_identifier) -> None:
         ''' Asks the user if they are sure to remove the mixture from the Library. '''
@@ -133,22 +289,37 @@ class LibraryUI:
         remove_dialog.toplevel.deiconify()
 
     def delete_mixture(self, mixture_identifier):
+        ''' Deletes the mixture, then closes its windows once the deletion is committed. '''
+
+        def deleted(future):
+            if self._write_done(future):
+                if mixture_identifier in self.opened_mixers:
+                    self.close_window(mixture_identifier, self.opened_mixers)
+                if mixture_identifier in self.opened_viewers:
+                    self.close_window(mixture_identifier, self.opened_viewers)
+
         if mixture_identifier is not None:
-            ObjectStorage(self.library_db_file, self.library_table_name).delete(mixture_identifier)
-            self.refresh_mixture_list()
-        if mixture_identifier in self.opened_mixers:
-            self.close_window(mixture_identifier, self.opened_mixers)
-        if mixture_identifier in self.opened_viewers:
-            self.close_window(mixture_identifier, self.opened_viewers)
+            self.storage_writer.delete(mixture_identifier, callback=deleted)
     
     def duplicate_mixture(self, mixture_identifier):
-        storage = ObjectStorage(self.library_db_file, self.library_table_name)
-        mixture_dict = self.mixtures[mixture_identifier]
-        mixture_dict['name'] = 'Copy of {}'.format(mixture_dict['name'])
-        storage.store(str(uuid.uuid4()), mixture_dict)
-        self.refresh_mixture_list()
+        self.duplicate_mixtures([mixture_identifier])
+    
+    def duplicate_mixtures(self, mixture_identifiers) -> None:
+        '''
+        Copies mixtures within the database in one transaction. Only the names of the copies
+        are written, which are taken from the list, so no mixture is loaded.
+        '''
+
+        copies = [(mixture_identifier, str(uuid.uuid4()),
+                {'name': 'Copy of {}'.format(self.treeview.item(mixture_identifier, 'text'))})
+            for mixture_identifier in mixture_identifiers if mixture_identifier in self.mixtures]
+        if copies:
+            self.storage_writer.copy_many(copies, callback=self._write_done)
     
     def close_window(self, window_key, opened_windows_dict):
+        if opened_windows_dict is self.opened_mixers:
+            # An update still pending from a scale drag would run on the destroyed widgets
+            opened_windows_dict[window_key].cancel_update()
         opened_windows_dict[window_key].toplevel.destroy()
         del opened_windows_dict[window_key]
     
@@ -162,7 +333,7 @@ class LibraryUI:
                     discard_callback_args=[mixture_identifier, self.opened_mixers])
                 if not create_new:  # Load existing
                     self.opened_mixers[mixture_identifier].load(
-                        copy.deepcopy(self.mixtures[mixture_identifier]))
+                        MixtureSnapshot.of(self.mixtures[mixture_identifier]))
                 self.opened_mixers[mixture_identifier].toplevel.protocol('WM_DELETE_WINDOW',
                     self.opened_mixers[mixture_identifier].show_discard_dialog)
                 if mixture_identifier in self.opened_viewers:
@@ -176,11 +347,11 @@ class LibraryUI:
             if mixture_identifier in self.mixtures:
                 if mixture_identifier not in self.opened_viewers:
                     viewer = BottleViewer(self.toplevel)
-                    mixture = copy.deepcopy(self.mixtures[mixture_identifier])
-                    viewer.set_name(mixture['name'])
-                    viewer.set_bottle_size(mixture['bottle_vol'])
-                    viewer.set_ingredients(mixture['ingredients'])
-                    viewer.set_notes(mixture['notes'])
+                    mixture = MixtureSnapshot.of(self.mixtures[mixture_identifier])
+                    viewer.set_name(mixture.name)
+                    viewer.set_bottle_size(mixture.bottle_vol)
+                    viewer.set_ingredients(mixture.ingredients)
+                    viewer.set_notes(mixture.notes)
                     self.opened_viewers[mixture_identifier] = viewer
                     self.opened_viewers[mixture_identifier].toplevel.protocol('WM_DELETE_WINDOW',
                         lambda: self.close_window(mixture_identifier, self.opened_viewers))
@@ -197,20 +368,200 @@ class LibraryUI:
         return 'break'
     
     def refresh_mixture_list(self) -> None:
-        self.mixtures = ObjectStorage(self.library_db_file, self.library_table_name).get_all()
+        '''
+        Rebuilds the list from its first page. Further pages are loaded by _load_pages as the
+        list is scrolled. Changes of single mixtures are applied by mixture_changed.
+        '''
+
+        storage = MixtureStorage(self.library_db_file, self.library_table_name)
+        summaries = self._get_page(storage)
+        self.mixtures = StoredObjectDict(storage, [summary.tag for summary in summaries])
         self.treeview.delete(*self.treeview.get_children())
 
-        for mixture_identifier in self.mixtures:
-            mixture = fludo.Mixture(*self.mixtures[mixture_identifier]['ingredients'])
-            mx_id = self.treeview.insert('', tk.END, id=mixture_identifier,
-                text=self.mixtures[mixture_identifier]['name'],
+        for summary in summaries:
+            self._insert_mixture(summary)
+        self._more_before = False
+        self._more_after = len(summaries) == PAGE_SIZE
+    
+    def _get_page(self, storage, after=None, before=None) -> list:
+        ''' Returns the summaries of the page after or before a mixture, in the list's order. '''
+
+        return storage.get_summaries_page(PAGE_SIZE, after=after, before=before,
+            search=self.search_text.get(), order_by=SORT_COLUMNS.get(self.sort_column),
+            descending=self.sort_descending)
+    
+    def _treeview_scrolled(self, first, last) -> None:
+        self.treeview_vscroll.set(first, last)
+        if not self._paging_scheduled and (
+                (self._more_after and float(last) > 1 - LOAD_MARGIN) or
+                (self._more_before and float(first) < LOAD_MARGIN)):
+            # Not while Tk is busy redrawing the Treeview that called us
+            self._paging_scheduled = True
+            self.toplevel.after_idle(self._load_pages)
+    
+    def _load_pages(self) -> None:
+        '''
+        Loads the next or previous page when the list is scrolled near its end or start, and drops
+        the page farthest from it, so the list never holds more than MAX_RESIDENT_PAGES pages.
+        Pages are found by keyset pagination from the last or first loaded mixture.
+        '''
+
+        self._paging_scheduled = False
+        first, last = self.treeview.yview()
+        children = self.treeview.get_children()
+        if not children:
+            return
+        storage = MixtureStorage(self.library_db_file, self.library_table_name)
+
+        if self._more_after and last > 1 - LOAD_MARGIN:
+            summaries = self._get_page(storage, after=children[-1])
+            self._more_after = len(summaries) == PAGE_SIZE
+            for summary in summaries:
+                self.mixtures.add(summary.tag)
+                self._insert_mixture(summary)
+            excess = children[:max(0,
+                len(children) + len(summaries) - PAGE_SIZE * MAX_RESIDENT_PAGES)]
+            if excess:
+                # Keep showing the same rows although the ones above them are gone
+                self.treeview.yview_scroll(-self._shown_rows(excess), 'units')
+                self._remove_mixtures(excess)
+                self._more_before = True
+        elif self._more_before and first < LOAD_MARGIN:
+            summaries = self._get_page(storage, before=children[0])
+            self._more_before = len(summaries) == PAGE_SIZE
+            for idx, summary in enumerate(summaries):
+                self.mixtures.add(summary.tag)
+                self._insert_mixture(summary, idx)
+            self.treeview.yview_scroll(self._shown_rows(
+                [summary.tag for summary in summaries]), 'units')
+            excess = children[PAGE_SIZE * MAX_RESIDENT_PAGES - len(summaries):]
+            if excess:
+                self._remove_mixtures(excess)
+                self._more_after = True
+    
+    def _shown_rows(self, mixture_identifiers) -> int:
+        ''' Returns the number of rows the mixtures take up in the list, with open ingredients. '''
+
+        return sum(1 + (len(self.treeview.get_children(mixture_identifier))
+                if self.treeview.item(mixture_identifier, 'open') else 0)
+            for mixture_identifier in mixture_identifiers)
+    
+    def _remove_mixtures(self, mixture_identifiers) -> None:
+        for mixture_identifier in mixture_identifiers:
+            self.mixtures.discard(mixture_identifier)
+        self.treeview.delete(*mixture_identifiers)
+    
+    def _list_index(self, storage, mixture_identifier):
+        '''
+        Returns where a mixture belongs among the loaded mixtures, or None if it belongs to a page
+        that isn't loaded. Positions are counted along the index of the sorted column.
+        '''
+
+        children = [child for child in self.treeview.get_children() if child != mixture_identifier]
+        if not children:
+            return 0
+        order_by = SORT_COLUMNS.get(self.sort_column)
+        index = storage.summary_position(mixture_identifier, order_by, self.sort_descending)
+        for offset, child in enumerate(children):
+            # Skips rows of mixtures whose deletion hasn't been announced yet
+            reference = storage.summary_position(child, order_by, self.sort_descending)
+            if reference is not None:
+                index += offset - reference
+                break
+        if index < 0:
+            return None if self._more_before else 0
+        if index >= len(children) and self._more_after:
+            return None
+        return min(index, len(children))
+    
+    def mixture_changed(self, event, mixture_identifier) -> None:
+        '''
+        Storage listener that updates, adds or removes only the changed mixture's row.
+        Falls back to refresh_mixture_list when the change can't be applied on its own.
+        '''
+
+        if event == 'deleted':
+            self.mixtures.discard(mixture_identifier)
+            if self.treeview.exists(mixture_identifier):
+                self.treeview.delete(mixture_identifier)
+        elif event == 'stored' and not self.search_text.get():
+            storage = MixtureStorage(self.library_db_file, self.library_table_name)
+            summary = storage.get_summary(mixture_identifier)
+            if summary is None:
+                return
+            index = self._list_index(storage, mixture_identifier)
+            if index is None:
+                # It's on a page that isn't loaded, it will show up when scrolled to
+                if self.treeview.exists(mixture_identifier):
+                    self._remove_mixtures([mixture_identifier])
+            elif self.treeview.exists(mixture_identifier):
+                self._update_mixture(summary)
+                self.treeview.move(mixture_identifier, '', index)
+            else:
+                self.mixtures.add(mixture_identifier)
+                self._insert_mixture(summary, index)
+        else:
+            # Whether a mixture matches the search is up to the full-text index
+            self.refresh_mixture_list()
+    
+    def sort_mixtures(self, column) -> None:
+        '''
+        Sorts the list by a Treeview column, or flips the order if it's sorted by it already.
+        The first page is read along the index of the column's summary in the database.
+        '''
+
+        if column == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.refresh_mixture_list()
+
+        for heading, text in self.heading_texts.items():
+            if heading == self.sort_column:
+                text += ' \u25bc' if self.sort_descending else ' \u25b2'
+            self.treeview.heading(heading, text=text)
+    
+    @staticmethod
+    def _mixture_values(summary) -> tuple:
+        return (
+            '{} / {}'.format(int(summary.pg), int(summary.vg)),
+            '{} mg'.format(round_digits(summary.nic, 1)),
+            '{} ml'.format(round_digits(summary.ml, 1)))
+    
+    def _insert_mixture(self, summary, index=tk.END) -> None:
+        self.treeview.insert('', index, id=summary.tag, text=summary.name,
+            values=self._mixture_values(summary))
+        self._insert_placeholder(summary)
+    
+    def _update_mixture(self, summary) -> None:
+        self.treeview.item(summary.tag, text=summary.name, values=self._mixture_values(summary))
+        self.treeview.delete(*self.treeview.get_children(summary.tag))
+        if self.treeview.item(summary.tag, 'open'):
+            self._insert_ingredients(summary.tag)
+        else:
+            self._insert_placeholder(summary)
+    
+    def _insert_placeholder(self, summary) -> None:
+        # A single hidden child keeps the expand indicator until the ingredients are needed
+        if summary.ingredient_count:
+            self.treeview.insert(summary.tag, tk.END, tags=('placeholder'))
+    
+    def expand_mixture(self, mixture_identifier) -> None:
+        ''' Replaces the placeholder of a mixture that is being opened with its ingredients. '''
+
+        if mixture_identifier not in self.mixtures:
+            return  # an ingredient row
+        children = self.treeview.get_children(mixture_identifier)
+        if children and self.treeview.tag_has('placeholder', children[0]):
+            self.treeview.delete(*children)
+            self._insert_ingredients(mixture_identifier)
+    
+    def _insert_ingredients(self, mixture_identifier) -> None:
+        for liquid in self.mixtures[mixture_identifier]['ingredients']:
+            self.treeview.insert(mixture_identifier, tk.END, text=liquid.name,
+                tags=('ingredient'),
                 values=(
-                    '{} / {}'.format(int(mixture.pg), int(mixture.vg)),
-                    '{} mg'.format(round_digits(mixture.nic, 1)),
-                    '{} ml'.format(round_digits(mixture.ml, 1))))
-            for liquid in self.mixtures[mixture_identifier]['ingredients']:
-                self.treeview.insert(mx_id, tk.END, text=liquid.name, tags=('ingredient'),
-                    values=(
-                        '{} / {}'.format(int(liquid.pg), int(liquid.vg)),
-                        '{} mg'.format(round_digits(liquid.nic, 1)),
-                        '{} ml'.format(round_digits(liquid.ml, 1))))
+                    '{} / {}'.format(int(liquid.pg), int(liquid.vg)),
+                    '{} mg'.format(round_digits(liquid.nic, 1)),
+                    '{} ml'.format(round_digits(liquid.ml, 1))))
@@ -1,8 +1,9 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
 
 import types
-from typing import Optional, Union
+from contextlib import contextmanager
+from typing import Iterable, Optional, Union
 
 import fludo
 
@@ -10,6 +11,9 @@ from common import (float_or_zero, round_digits, center_toplevel, CreateToolTip,
     FloatEntryDialog, FloatValidator, BaseDialog, VerticalScrolledFrame, TextDialog)
 from images import icons, set_icon
 from viewer import BottleViewer
+from mixture_snapshot import MixtureSnapshot
+from mixture_model import MixtureModel
+from mixture_solver import SolvedMixture, solve_mixture
 
 CONTAINER_MIN = 10
 CONTAINER_MAX = 10000
@@ -217,10 +221,83 @@ class NewIngredientDialog(BaseDialog):
         super().close()
 
 
+class TargetProfileDialog(BaseDialog, FloatValidator):
+    '''
+    Asks for the PG/VG ratio, nicotine strength and bottle volume the Mixer should mix, and the
+    ingredients that keep their volume. Passes pg, vg, nic, bottle_vol and the indices of the
+    kept ingredients to the callback.
+    '''
+
+    def configure_widgets(self, **kwargs):
+        self.pg = tk.StringVar()
+        self.pg.set(round(kwargs['pg'], 1))
+        self.vg = tk.StringVar()
+        self.vg.set(round(kwargs['vg'], 1))
+        self.nic = tk.StringVar()
+        self.nic.set(round(kwargs['nic'], 1))
+        self.bottle_vol = tk.StringVar()
+        self.bottle_vol.set(kwargs['bottle_vol'])
+
+        # VG can only make up the rest of the PG, the remainder is water
+        self.get_max_vg = lambda: 100 - float_or_zero(self.pg.get())
+
+        self.entry_validator = self.frame.register(self.validate_float_entry)
+        rows = [
+            ('PG (% vol.):', self.pg, 'pg_entry', 0, 100),
+            ('VG (% vol.):', self.vg, 'vg_entry', 0, 'get_max_vg'),
+            ('Nicotine (mg/ml):', self.nic, 'nic_entry', 0, MAX_NIC_CONCENTRATION),
+            ('Bottle (ml):', self.bottle_vol, 'bottle_vol_entry', CONTAINER_MIN, CONTAINER_MAX),
+        ]
+        for row, (text, variable, entry_name, min_value, max_value) in enumerate(rows, 1):
+            ttk.Label(self.frame, text=text).grid(row=row, column=0, sticky=tk.E, padx=5, pady=5)
+            entry = ttk.Entry(self.frame, width=25, textvariable=variable)
+            entry.configure(validate='all', validatecommand=(self.entry_validator, '%d', '%P',
+                entry_name, min_value, max_value))
+            entry.grid(row=row, column=1, sticky=tk.E)
+            setattr(self, entry_name, entry)
+        self.pg_entry.focus()
+
+        # The filler fills the bottle, its volume can't be kept
+        self.keep = []
+        if kwargs['ingredient_names']:
+            ttk.Label(self.frame, text='Keep the volume of:').grid(
+                row=5, column=0, sticky=tk.NE, padx=5, pady=5)
+        keep_frame = ttk.Frame(self.frame)
+        keep_frame.grid(row=5, column=1, sticky=tk.W, pady=5)
+        for idx, name in enumerate(kwargs['ingredient_names']):
+            keep = tk.IntVar()
+            checkbox = ttk.Checkbutton(keep_frame, text=name, variable=keep)
+            if idx == kwargs['filler_idx']:
+                checkbox.configure(text='%s (fills bottle)' % name, state=tk.DISABLED)
+            checkbox.grid(row=idx, column=0, sticky=tk.W)
+            self.keep.append(keep)
+
+        self.ok_button.configure(text='Mix', width=15)
+        self.cancel_button = ttk.Button(self.frame, text='Cancel', width=15,
+            command=lambda: self.close(False))
+        self.cancel_button.grid(row=10, column=1, padx=16, sticky=tk.E)
+        self.ok_button.grid(row=10, column=0, padx=16, sticky=tk.W)
+    
+    def close(self, ok_clicked, **kwargs):
+        ''' Close and pass the target profile to the callback if ok_button is clicked. '''
+
+        super().close()
+
+        if ok_clicked:
+            self.callback(
+                float_or_zero(self.pg.get()),
+                float_or_zero(self.vg.get()),
+                float_or_zero(self.nic.get()),
+                max(CONTAINER_MIN, float_or_zero(self.bottle_vol.get())),
+                [idx for idx, keep in enumerate(self.keep) if keep.get()])
+
+
 class Mixer:
     '''
     This is the main class of Mixer. It creates the Liquid Mixer toplevel window and manages its
     MixerIngredientController objects (the ingredients of the mixture).
+    The numbers of the mixture are kept by a MixtureModel, the Mixer passes the changes made in
+    its widgets on to the model and shows what the model calculates.
     '''
 
     def __init__(self, parent: tk.Widget = None, mixture_name: str = DEFAULT_MIXTURE_NAME,
@@ -315,27 +392,33 @@ class Mixer:
         set_icon(self.view_bottle_button, icons['bottle-icon'])
         self.view_bottle_button.grid(row=0, column=1)
         
+        self.target_button = ttk.Button(self.button_frame, text='Target Profile', width=22,
+            command=self.show_target_dialog)
+        self.target_button_ttip = CreateToolTip(self.target_button,
+            'Work out the volumes of the ingredients\nfor a PG/VG ratio and nicotine strength.')
+        set_icon(self.target_button, icons['sliders'])
+        self.target_button.grid(row=0, column=2)
+        
         self.add_notes_button = ttk.Button(self.button_frame, text='Add Notes', width=22,
             command=self.show_add_notes_dialog)
         set_icon(self.add_notes_button, icons['file'])
-        self.add_notes_button.grid(row=0, column=2)
+        self.add_notes_button.grid(row=0, column=3)
 
         self.save_button = ttk.Button(self.button_frame, text='Save & Close', width=22,
             command=lambda: self.close(True))
         set_icon(self.save_button, icons['save'])
-        self.save_button.grid(row=0, column=3)
+        self.save_button.grid(row=0, column=4)
 
         self.discard_button = ttk.Button(self.button_frame, text='Discard & Close', width=22,
             command=self.show_discard_dialog)
         set_icon(self.discard_button, icons['x-square'])
-        self.discard_button.grid(row=0, column=4)
+        self.discard_button.grid(row=0, column=5)
  
         self.fill_set = False
 
         self._labels_shown = False
-        self._ingredient_list = []
-        self._bottle_vol = 100  # Default to 100ml
-        self.total_cost = 0
+        self._ingredient_list = []  # in the order of the liquids of the model
+        self.model = MixtureModel(bottle_vol=100)  # Default to 100ml
         self.notes = DEFAULT_NOTES_CONTENT
         self.save_callback = save_callback
         self.save_callback_args = save_callback_args
@@ -349,6 +432,17 @@ class Mixer:
 
         self.bottle_viewer = None
 
+        # Changes made with the scales and entries are shown by one update when Tk is idle
+        self._update_after_id = None
+        self._update_skip = None  # the ingredient that changed last, see update()
+        self._pending_events = 0  # changes not shown yet
+        self._updates_suspended = 0  # depth of suspended_updates() blocks
+        self._suspended_update = False  # whether an update was asked for while suspended
+        self.update_events = 0  # changes that asked for an update
+        self.updates_run = 0  # updates run, scheduled or not
+        self.last_coalesced = 0  # changes shown by the last update
+        self.max_coalesced = 0  # most changes shown by one update
+
         # center_toplevel(self.toplevel)
         # self.toplevel.lift()
         self.toplevel.deiconify()
@@ -379,14 +473,11 @@ class Mixer:
         if ml < CONTAINER_MIN:
             raise Exception('Parameter ml smaller than minimum allowed!')
         
-        ratio = ml / self._bottle_vol
-        self._bottle_vol = ml
-
-        # Recalc every ingredients volume to preserve ratio.
-        for ingredient in self._ingredient_list:
-            new_value = float_or_zero(ingredient.ml.get()) * ratio
-            ingredient.ml_scale.configure(to=new_value + 1)  # dummy scale limit change
-            ingredient.ml_scale.set(new_value)  # so that we can update it
+        # The model scales every ingredient to preserve the ratio. The new volumes are shown
+        # without their traces passing them back, the update limits the scales to them.
+        self.model.set_bottle_volume(ml)
+        for ingredient, liquid in zip(self._ingredient_list, self.model.liquids):
+            ingredient.show_ml(liquid.ml)
         
         if self.bottle_viewer is not None:
             self.bottle_viewer.set_bottle_size(self.get_bottle_volume())
@@ -396,11 +487,11 @@ class Mixer:
     def get_bottle_volume(self) -> Union[int, float]:
         ''' Returns the current volume (size) of the bottle in milliliters. '''
 
-        try:
-            return self._bottle_vol
-        except AttributeError:
-            self._bottle_vol = 10
-            return 10
+        return self.model.bottle_vol
+    
+    @property
+    def total_cost(self) -> float:
+        return self.model.cost
     
     def show_bottle_viewer(self) -> None:
         if self.bottle_viewer is None:
@@ -429,13 +520,59 @@ class Mixer:
                       'Minimum size is {} ml, max. is {} ml.').format(CONTAINER_MIN,
                         CONTAINER_MAX),
                 min_value=CONTAINER_MIN, max_value=CONTAINER_MAX,
-                default_value=self._bottle_vol,
+                default_value=self.model.bottle_vol,
                 callback=self.set_bottle_volume,
                 destroy_on_close=False)
         self.change_bottle_dialog.toplevel.deiconify()
         self.change_bottle_dialog.entry.focus()
         self.change_bottle_dialog.entry.select_range(0, tk.END)
     
+    def show_target_dialog(self) -> None:
+        ''' Opens a dialog that lets the user mix a target profile with the ingredients. '''
+
+        # Made every time, as it lists the ingredients
+        model = self.model
+        TargetProfileDialog(self.toplevel, self._solve_target_dialog,
+            window_title='Target Profile',
+            text='Enter the profile to mix with the ingredients below:',
+            pg=model.pg, vg=model.vg, nic=model.nic, bottle_vol=model.bottle_vol,
+            ingredient_names=[ingredient.name.get() for ingredient in self._ingredient_list],
+            filler_idx=model.filler_idx).toplevel.deiconify()
+    
+    def _solve_target_dialog(self, *args) -> None:
+        try:
+            self.solve_target(*args)
+        except ValueError as e:
+            messagebox.showerror('Eliq', str(e), parent=self.toplevel)
+    
+    def solve_target(self, pg: float, vg: float, nic: float,
+            bottle_vol: Optional[Union[int, float]] = None,
+            fixed: Iterable[int] = ()) -> Optional[SolvedMixture]:
+        '''
+        Sets the volumes of the ingredients so they mix to pg and vg percent and nic mg/ml in a
+        bottle of bottle_vol ml (the current one by default), see solve_mixture. The ingredients
+        of the fixed indices keep their volume, the filler fills the bottle. The rows are filled
+        in with a single update. Returns the SolvedMixture, whose profile is the closest the
+        ingredients can get, or None if there are no ingredients.
+        '''
+
+        model = self.model
+        if not model.liquids:
+            return None
+        if bottle_vol is None:
+            bottle_vol = model.bottle_vol
+        solved = solve_mixture(model.liquids, bottle_vol, pg, vg, nic,
+            fixed={idx: model.liquids[idx].ml for idx in fixed}, filler_idx=model.filler_idx)
+
+        with self.suspended_updates():
+            if bottle_vol != model.bottle_vol:
+                self.set_bottle_volume(bottle_vol)
+            model.set_volumes(solved.volumes)
+            for ingredient, liquid in zip(self._ingredient_list, model.liquids):
+                ingredient.show_ml(liquid.ml)
+            self.update()
+        return solved
+    
     def set_notes(self, notes: str) -> None:
         self.notes = notes
 
@@ -506,11 +643,14 @@ class Mixer:
         else:
             raise TypeError('Paremeter liquid_or_ingredient isn\'t the right type.')
 
+        self._append_ingredient(ingredient)
+        self.model.add(ingredient.liquid)  # its scale is limited by the update below
+        self.update()
+    
+    def _append_ingredient(self, ingredient: 'MixerIngredientController') -> None:
+        ''' Adds the row of an ingredient, without adding its liquid to the model. '''
+
         self.frame.interior.grid_rowconfigure(self.get_ingredient_grid_row(ingredient), minsize=30)
-        current_total_vol = sum([float_or_zero(row.ml.get()) for row in self._ingredient_list])
-        remaining_vol = self._bottle_vol - current_total_vol
-        ingredient.ml_scale.configure(to=remaining_vol)
-        ingredient.ml_max.set(remaining_vol)
 
         self._ingredient_list.append(ingredient)
 
@@ -519,8 +659,6 @@ class Mixer:
             self.add_button_ttip = CreateToolTip(self.add_button,
                 'Max number of ingredients reached.')
 
-        self.update()
-
         # Hide start message
         if not self._labels_shown:
             self.labels_frame.grid(row=2, column=0, sticky=tk.E)
@@ -568,16 +706,10 @@ class Mixer:
         if ingredient.fill_set:
             self.toggle_fill(ingredient)
         
-        for widget in self.frame.interior.grid_slaves():
-            try:
-                if widget.grid_info()['row'] == grid_row_idx:
-                    widget.grid_forget()
-                    widget.destroy()
-            except KeyError:
-                # Already deleted by a parent widget while iterating
-                pass
-        self._ingredient_list.remove(ingredient_or_idx)
-        self.frame.interior.grid_rowconfigure(grid_row_idx, minsize=0)  # Hide row
+        self._destroy_rows({grid_row_idx})
+        idx = self.get_ingredient_idx(ingredient)
+        del self._ingredient_list[idx]
+        self.model.remove(idx)
 
         if len(self._ingredient_list) < MAX_INGREDIENTS:
             self.add_button.configure(state=tk.NORMAL)
@@ -592,11 +724,25 @@ class Mixer:
             self.start_label.grid(row=998, column=0, columnspan=6, sticky=tk.E)
             self._labels_shown = False
     
+    def _destroy_rows(self, grid_rows: Iterable[int]) -> None:
+        ''' Destroys the widgets in the grid rows of the ingredients, and hides the rows. '''
+
+        for widget in self.frame.interior.grid_slaves():
+            try:
+                if widget.grid_info()['row'] in grid_rows:
+                    widget.grid_forget()
+                    widget.destroy()
+            except KeyError:
+                # Already deleted by a parent widget while iterating
+                pass
+        for grid_row_idx in grid_rows:
+            self.frame.interior.grid_rowconfigure(grid_row_idx, minsize=0)
+
     def get_mixture(self) -> Union[fludo.Mixture, None]:
         ''' Returns a fludo.Mixture that results from mixing every ingredient. '''
 
         if len(self._ingredient_list) > 0:
-            return fludo.Mixture(*[ingredient.liquid for ingredient in self._ingredient_list])
+            return self.model.mixture()
         else:
             return None
     
@@ -608,12 +754,10 @@ class Mixer:
     def get_last_grid_row(self) -> int:
         ''' Returns the last grid row that doesn't have an ingredient's widgets. '''
 
-        last_row = -1
-        for row in self._ingredient_list:
-            grid_row_idx = row.name_label.grid_info()['row']
-            if grid_row_idx > last_row:
-                last_row = grid_row_idx
-        return last_row + 1
+        # Ingredients are only ever appended below the last one, so it has the highest row
+        if not self._ingredient_list:
+            return 0
+        return self._ingredient_list[-1].name_label.grid_info()['row'] + 1
     
     def get_ingredient_grid_row(self,
             ingredient_or_idx: Union['MixerIngredientController', int]) -> int:
@@ -627,6 +771,7 @@ class Mixer:
     def toggle_fill(self, ingredient: 'MixerIngredientController') -> None:
         ''' Toggles the fill behaviour on the ingredients. '''
 
+        self.model.set_filler(None if ingredient.fill_set else self.get_ingredient_idx(ingredient))
         for row in self._ingredient_list:
             if row == ingredient:
                 if ingredient.fill_set:
@@ -646,15 +791,13 @@ class Mixer:
         flag is not set on any of the ingredients.
         '''
 
-        for idx, row in enumerate(self._ingredient_list):
-            if row.fill_set:
-                return idx
-        return None
+        return self.model.filler_idx
     
     def load(self, loadable_dict) -> None:
         '''
         Throws away any ingredient in the Mixer and reloads ingredients from a loadable dict, so
         it be used to pre-populate ingredients for example when opening a previously saved mixture.
+        A MixtureSnapshot can be loaded as well, its liquids are copied since the Mixer edits them.
         Mixer.get_loadable() returns a loadable dict, which looks like this:
 
         loadable_dict = {
@@ -668,6 +811,8 @@ class Mixer:
 
         if not loadable_dict:
             return
+        if isinstance(loadable_dict, MixtureSnapshot):
+            loadable_dict = loadable_dict.dump()
         
         if ('ingredients' not in loadable_dict or
                 'filler_idx' not in loadable_dict or
@@ -686,30 +831,47 @@ class Mixer:
         if len(loadable_dict['ingredients']) > MAX_INGREDIENTS:
             raise ValueError('Number of ingredients exceeds the maximum allowed!')
 
-        # Seems okay, purge and load:
+        # Seems okay, purge and load. The rows are built without updating the Mixer, the model
+        # sums the liquids up once and a single update at the end shows them.
 
-        for ingredient in self._ingredient_list:
-            self.remove_ingredient(ingredient)
-        
-        self.set_bottle_volume(loadable_dict['bottle_vol'])
+        with self.suspended_updates():
+            self._destroy_rows({self.get_ingredient_grid_row(ingredient)
+                for ingredient in self._ingredient_list})
+            self._ingredient_list = []
+            self.fill_set = False
+            self.add_button.configure(state=tk.NORMAL)
+            self.add_button_ttip = CreateToolTip(self.add_button,
+                'Add new ingredient to the mixture.')
 
-        for liquid in loadable_dict['ingredients']:
-            self.add_ingredient(liquid)
-        
-        if loadable_dict['filler_idx'] is not None:
-            self.toggle_fill(self._ingredient_list[loadable_dict['filler_idx']])
-        
-        if 'name' in loadable_dict:
-            self.rename(loadable_dict['name'])
-        else:
-            self.rename(DEFAULT_MIXTURE_NAME)
-        
-        if 'notes' in loadable_dict:
-            self.set_notes(loadable_dict['notes'])
-        else:
-            self.set_notes(DEFAULT_NOTES_CONTENT)
-        
-        self.update()
+            # The volume of a new row is set before its trace is, so no change is passed on
+            for liquid in loadable_dict['ingredients']:
+                self._append_ingredient(MixerIngredientController(self, liquid, auto_add=False))
+            self.model.load([ingredient.liquid for ingredient in self._ingredient_list],
+                loadable_dict['bottle_vol'], loadable_dict['filler_idx'])
+
+            if loadable_dict['filler_idx'] is not None:
+                self._ingredient_list[loadable_dict['filler_idx']]._set_fill()
+                self.fill_set = True
+
+            if not self._ingredient_list:
+                self.labels_frame.grid_forget()
+                self.start_label.grid(row=998, column=0, columnspan=6, sticky=tk.E)
+                self._labels_shown = False
+
+            if self.bottle_viewer is not None:
+                self.bottle_viewer.set_bottle_size(self.get_bottle_volume())
+            
+            if 'name' in loadable_dict:
+                self.rename(loadable_dict['name'])
+            else:
+                self.rename(DEFAULT_MIXTURE_NAME)
+            
+            if 'notes' in loadable_dict:
+                self.set_notes(loadable_dict['notes'])
+            else:
+                self.set_notes(DEFAULT_NOTES_CONTENT)
+            
+            self.update()
         # center_toplevel(self.toplevel)
     
     def dump(self) -> dict:
@@ -726,6 +888,55 @@ class Mixer:
             'notes': self.get_notes()
         }
     
+    def ingredient_changed(self, ingredient: 'MixerIngredientController') -> None:
+        ''' Called when the volume of an ingredient is changed in its entry or with its scale. '''
+
+        idx = self.get_ingredient_idx(ingredient)
+        if idx is not None:  # not while it's being added
+            self.model.set_ml(idx, float_or_zero(ingredient.ml.get()))
+        self.schedule_update(ingredient)
+    
+    def schedule_update(self, skip_limiting_ingredient:
+            Optional['MixerIngredientController'] = None) -> None:
+        '''
+        Asks for an update when Tk is idle. A scale fires a change for every pixel it's dragged,
+        the changes made until Tk gets idle are shown by a single update. The model always has
+        the numbers of every change already, only showing them is put off.
+        '''
+
+        self.update_events += 1
+        self._pending_events += 1
+        self._update_skip = skip_limiting_ingredient
+        if self._update_after_id is None:
+            self._update_after_id = self.toplevel.after_idle(self._scheduled_update)
+
+    def _scheduled_update(self) -> None:
+        self._update_after_id = None
+        self.update(self._update_skip)
+
+    def cancel_update(self) -> None:
+        ''' Drops the scheduled update, if there is one. '''
+
+        if self._update_after_id is not None:
+            self.toplevel.after_cancel(self._update_after_id)
+            self._update_after_id = None
+
+    @contextmanager
+    def suspended_updates(self):
+        '''
+        Context manager that holds back the updates asked for in its block, then runs one
+        update at its end if any was asked for.
+        '''
+
+        self._updates_suspended += 1
+        try:
+            yield
+        finally:
+            self._updates_suspended -= 1
+            if not self._updates_suspended and self._suspended_update:
+                self._suspended_update = False
+                self.update()
+
     def update(self, skip_limiting_ingredient:
             Optional['MixerIngredientController'] = None) -> None:
         '''
@@ -734,22 +945,28 @@ class Mixer:
         possible maximum volume that can be entered.
         Because the limit is constantly recalculated, to avoid rounding errors on the instance
         that's currently changed by the user, the changing instance can be skipped from limiting.
+        Every number shown comes from the model, no ingredient is read back from its widgets.
+        It also shows the changes a scheduled update was going to, which is dropped.
+        Within suspended_updates() it's only noted, to run once at the end of the block.
         '''
 
+        if self._updates_suspended:
+            self._suspended_update = True
+            return
+
+        self.cancel_update()
+        self.updates_run += 1
+        self.last_coalesced = self._pending_events
+        self.max_coalesced = max(self.max_coalesced, self._pending_events)
+        self._pending_events = 0
+
         # The ingredient which is currently calling this update when using it's scale should be
         # skipped from the limit calculation.
 
-        # Calc current total volume of ingredients (skipping ingredient that has the fill flag).
-        current_total_vol = sum([float_or_zero(ingredient.ml.get())
-            for ingredient in self._ingredient_list if not ingredient.fill_set])
-        
-        # Calc free volume within the bottle
-        free_volume = self._bottle_vol - current_total_vol
-
-        new_total_cost = 0
-        for ingredient in self._ingredient_list:
+        model = self.model
+        for idx, ingredient in enumerate(self._ingredient_list):
             # Clac ingredients possible max volume rounded to 1 digits of precision
-            ingredient_max = int((float_or_zero(ingredient.ml.get()) + free_volume) * 10) / 10
+            ingredient_max = model.max_ml(idx)
 
             # Limit the scale and set the max label
             if ingredient != skip_limiting_ingredient:
@@ -757,7 +974,7 @@ class Mixer:
                 ingredient.ml_max.set(ingredient_max)
             
             # If the remaining volume is smaller than the rounding error, set max label to 'Full'
-            if free_volume < 0.1:
+            if model.full:
                 ingredient.ml_max.set('Full')
             else:
                 ingredient.ml_max.set(ingredient.ml_scale['to'])
@@ -766,28 +983,23 @@ class Mixer:
             if ingredient.fill_set:
                 ingredient.ml_max.set('')
 
-            # Update the volume of the liquid represented by the ingredient instance.
-            # This propagates the change of the ml variable to the liquid object.
-            ingredient.liquid.update_ml(float_or_zero(ingredient.ml.get()))
-            new_total_cost = ingredient.liquid.get_cost()
-        
-        self.total_cost = new_total_cost
+            # Show the volume the model fills the bottle with. Setting it only when it changed
+            # keeps the trace of a row that is being toggled from calling back in here.
+            if idx == model.filler_idx and float_or_zero(ingredient.ml.get()) != model.liquids[idx].ml:
+                ingredient.ml.set(model.liquids[idx].ml)
         
         # Update the status bar message
-        if self.fill_set or free_volume < 0.1:
+        if self.fill_set or model.full:
             self.liquid_volume.set(' |  Vol. %(limit).1f ml (bottle full)' % {
-                'limit': self._bottle_vol})
+                'limit': model.bottle_vol})
         else:
             self.liquid_volume.set(' |  Vol. %(vol).1f ml (in %(limit).1f ml. bottle)' % {
-                'vol': sum([float_or_zero(ingredient.ml.get())
-                    for ingredient in self._ingredient_list]),
-                'limit': self._bottle_vol})
+                'vol': model.ml,
+                'limit': model.bottle_vol})
         
-        mixture = self.get_mixture()
-
-        if mixture:
+        if self._ingredient_list:
             self.mixture_description.set('%d%% PG / %d%% VG, Nic. %.1f mg/ml, Cost: %.1f' % (
-                mixture.pg, mixture.vg, mixture.nic, mixture.get_cost()))
+                model.pg, model.vg, model.nic, model.cost))
         else:
             self.mixture_description.set('Nothing to mix. |')
         
@@ -796,13 +1008,16 @@ class Mixer:
     
     def close(self, save: bool = False) -> None:
         '''
-        Optionally calls the save callback then closes the mixer.
+        Optionally calls the save callback then closes the mixer. A save callback closes the
+        mixer itself, once the mixture is saved.
         '''
 
         if save and self.save_callback:
             self.save_callback(self.dump(), *self.save_callback_args)
+            return
         else:
             self.discard_callback(*self.discard_callback_args)
+        self.cancel_update()
         self.toplevel.destroy()
 
 
@@ -829,8 +1044,7 @@ class MixerIngredientController(FloatValidator):
 
         self.ml = tk.StringVar()
         self.ml.set(float(self.liquid.ml))
-        self._ml_traceid = self.ml.trace('w', lambda var, idx, op:
-            self.mixer.update(self))
+        self._add_ml_trace()
 
         self.name = tk.StringVar()
         self.name.set(self.liquid.name)
@@ -907,54 +1121,49 @@ class MixerIngredientController(FloatValidator):
         if auto_add:
             self.mixer.add_ingredient(self)
     
-    def _unset_fill(self) -> None:
-        ''' Only Mixer must call this when toggling the fill. '''
+    def _add_ml_trace(self) -> None:
+        ''' Passes the changes of the volume on to the Mixer, unless it's done already. '''
 
-        self.fill_label.grid_forget()
-        self.ml_scale.grid(row=self.mixer.get_ingredient_grid_row(self), column=1, sticky=tk.EW)
-        self.ml_entry.configure(state='normal')
-    
+        if not hasattr(self, '_ml_traceid'):
+            self._ml_traceid = self.ml.trace('w', lambda var, idx, op:
+                self.mixer.ingredient_changed(self))
+
+    def _remove_ml_trace(self) -> None:
         try:
-            self.ml_max.trace_vdelete('w', self._fill_traceid)
-            del(self._fill_traceid)
+            self.ml.trace_vdelete('w', self._ml_traceid)
+            del(self._ml_traceid)
         except (AttributeError, tk._tkinter.TclError):
             # not set
             pass
-        
-        try:
-            self._ml_traceid
-        except AttributeError:
-            self._ml_traceid = self.ml.trace('w', lambda var, idx, op:
-                self.mixer.update(self))
-        
-        self.mixer.update(self)
+
+    def show_ml(self, ml: Union[int, float]) -> None:
+        ''' Shows a volume the model has already, without passing it on as a change. '''
+
+        traced = hasattr(self, '_ml_traceid')
+        self._remove_ml_trace()
+        self.ml.set(ml)
+        if traced:
+            self._add_ml_trace()
+
+    def _unset_fill(self) -> None:
+        ''' Only Mixer must call this when toggling the fill, it updates once they're toggled. '''
+
+        self.fill_label.grid_forget()
+        self.ml_scale.grid(row=self.mixer.get_ingredient_grid_row(self), column=1, sticky=tk.EW)
+        self.ml_entry.configure(state='normal')
+        self._add_ml_trace()
         set_icon(self.fill_button, icons['bottle-icon-fill'], compound=tk.NONE)
         self.fill_set = False
 
     def _set_fill(self) -> None:
-        ''' Only Mixer must call this when toggling the fill. '''
+        ''' Only Mixer must call this when toggling the fill, it updates once they're toggled. '''
 
         self.ml_scale.grid_forget()
         self.fill_label.grid(row=self.mixer.get_ingredient_grid_row(self), column=1)
         self.ml_entry.configure(state='readonly')
 
-        try:
-            self.ml.trace_vdelete('w', self._ml_traceid)
-            del(self._ml_traceid)
-        except (AttributeError, tk._tkinter.TclError):
-            # not set
-            pass
-
-        try:
-            self._fill_traceid
-        except AttributeError:
-            self._fill_traceid = self.ml_max.trace('w', lambda var, idx, op:
-                self.ml.set(
-                    int((self.mixer.get_bottle_volume() - sum([float_or_zero(ingr.ml.get())
-                        for ingr in self.mixer._ingredient_list if ingr != self])) * 10) / 10
-                ))
-        
-        self.mixer.update(self)
+        # The model sets its volume from now on, which Mixer.update shows
+        self._remove_ml_trace()
         set_icon(self.fill_button, icons['bottle-icon-filled'], compound=tk.NONE)
         self.fill_set = True
 
@@ -994,6 +1203,11 @@ class MixerIngredientController(FloatValidator):
     def set_liquid(self, liquid: fludo.Liquid) -> None:
         ''' Sets the liquid the controller represents. '''
 
+        if liquid.ml <= 0:  # keeps the volume it has in the mixture
+            liquid.update_ml(self.liquid.ml)
+        idx = self.mixer.get_ingredient_idx(self)
+        if idx is not None:
+            self.mixer.model.set_liquid(idx, liquid)
         self.liquid = liquid
         if self.liquid.ml > 0:
             self.ml.set(self.liquid.ml)
@@ -0,0 +1,80 @@
+from collections import namedtuple
+from itertools import chain
+from operator import attrgetter
+from typing import Iterable, List, Sequence, Union
+
+import numpy as np
+import fludo
+
+from mixture_snapshot import IngredientSnapshot
+
+LIQUID_COLUMNS = ('ml', 'pg', 'vg', 'nic', 'cost_per_ml')  # columns of MixtureBatch.liquids
+
+_liquid_columns = attrgetter(*LIQUID_COLUMNS)
+
+MixtureProperties = namedtuple('MixtureProperties', ['ml', 'pg', 'vg', 'nic', 'cost'])
+
+
+class MixtureBatch:
+    '''
+    Many mixtures packed into NumPy arrays, so their properties are calculated for all of them
+    at once. The liquids of every mixture are the rows of one (n, 5) array with the columns of
+    LIQUID_COLUMNS, one mixture after the other; counts holds how many rows each has, so the
+    mixtures can have any number of ingredients, none as well.
+
+    evaluate() gives the same numbers as a fludo.Mixture of each mixture's liquids, up to the
+    last bit: the amounts of each mixture are added up in the order of its liquids, like
+    fludo.Mixture.add does.
+    '''
+
+    def __init__(self, mixtures: Iterable[Sequence[Union[fludo.Liquid, IngredientSnapshot]]]):
+        mixtures = [list(liquids) for liquids in mixtures]
+        self.counts = np.fromiter((len(liquids) for liquids in mixtures), np.intp,
+            len(mixtures))
+        values = chain.from_iterable(map(_liquid_columns, chain.from_iterable(mixtures)))
+        self.liquids = np.fromiter(values, np.float64,
+            int(self.counts.sum()) * len(LIQUID_COLUMNS)).reshape(-1, len(LIQUID_COLUMNS))
+
+    @classmethod
+    def of_dicts(cls, mixture_dicts: Iterable[dict]) -> 'MixtureBatch':
+        ''' Packs the ingredients of Mixer dumps. '''
+
+        return cls(mixture_dict['ingredients'] for mixture_dict in mixture_dicts)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def evaluate(self) -> MixtureProperties:
+        '''
+        Returns the volume, PG and VG percentage, nicotine concentration and cost of every
+        mixture, as arrays in the order of the mixtures. Mixtures without volume are 50/50 with
+        no nicotine, like an empty fludo.Mixture.
+        '''
+
+        ml, pg, vg, nic, cost_per_ml = self.liquids.T
+        mixture_idx = np.repeat(np.arange(len(self.counts)), self.counts)
+
+        def per_mixture(amounts: np.ndarray) -> np.ndarray:
+            # bincount adds the amounts up one after the other, in the order of the liquids
+            return np.bincount(mixture_idx, amounts, minlength=len(self.counts))
+
+        total_ml = per_mixture(ml)
+        total_pgml = per_mixture(ml * (pg / 100))
+        total_vgml = per_mixture(ml * (vg / 100))
+        total_nicmg = per_mixture(nic * ml)
+        total_cost = per_mixture(ml * cost_per_ml)
+
+        mixed = total_ml > 0
+        divisor = np.where(mixed, total_ml, 1)
+        return MixtureProperties(
+            total_ml,
+            np.where(mixed, total_pgml / divisor * 100, 50.0),
+            np.where(mixed, total_vgml / divisor * 100, 50.0),
+            np.where(mixed, total_nicmg / divisor, 0.0),
+            total_cost,
+        )
+
+    def rows(self) -> List[tuple]:
+        ''' Returns the (ml, pg, vg, nic, cost) of every mixture as tuples of Python floats. '''
+
+        return list(zip(*(values.tolist() for values in self.evaluate())))
@@ -0,0 +1,179 @@
+import math
+from typing import List, Optional, Union
+
+import fludo
+
+EMPTY_ML = 1e-9  # total volumes below this are rounding leftovers of an empty mixture
+
+
+class MixtureModel:
+    '''
+    The numbers behind the Mixer, without any Tk: the liquids of the ingredients, the bottle
+    volume and the filler ingredient, whose volume fills up the rest of the bottle.
+
+    Running totals of the volume, PG, VG, nicotine and cost of the mixture are kept, so setting
+    the volume of an ingredient only takes its old amounts off them and adds the new ones,
+    no matter how many ingredients there are. Adding or removing an ingredient and resizing the
+    bottle sum them up again, which also drops the rounding errors that piled up until then.
+    The liquids given to the model are the ones it updates.
+    '''
+
+    def __init__(self, bottle_vol: Union[int, float] = 100):
+        self.liquids = []  # fludo.Liquid of every ingredient, in order
+        self.bottle_vol = bottle_vol
+        self.filler_idx = None
+
+        self.ml = 0.0
+        self.pg_ml = 0.0
+        self.vg_ml = 0.0
+        self.nic_mg = 0.0
+        self.cost = 0.0
+
+    def __len__(self) -> int:
+        return len(self.liquids)
+
+    def _add_totals(self, liquid: fludo.Liquid, sign: int = 1) -> None:
+        self.ml += sign * liquid.ml
+        self.pg_ml += sign * liquid.total_pgml
+        self.vg_ml += sign * liquid.total_vgml
+        self.nic_mg += sign * liquid.total_nicmg
+        self.cost += sign * liquid.total_cost
+
+    def recalculate(self) -> None:
+        ''' Sums the totals up from the liquids. '''
+
+        self.ml = math.fsum(liquid.ml for liquid in self.liquids)
+        self.pg_ml = math.fsum(liquid.total_pgml for liquid in self.liquids)
+        self.vg_ml = math.fsum(liquid.total_vgml for liquid in self.liquids)
+        self.nic_mg = math.fsum(liquid.total_nicmg for liquid in self.liquids)
+        self.cost = math.fsum(liquid.total_cost for liquid in self.liquids)
+
+    @property
+    def filler_ml(self) -> float:
+        return 0.0 if self.filler_idx is None else self.liquids[self.filler_idx].ml
+
+    @property
+    def free_volume(self) -> float:
+        ''' Volume of the bottle that isn't taken by the ingredients other than the filler. '''
+
+        return self.bottle_vol - (self.ml - self.filler_ml)
+
+    @property
+    def full(self) -> bool:
+        ''' Whether the remaining volume is smaller than the 0.1 ml the Mixer rounds to. '''
+
+        return self.free_volume < 0.1
+
+    def max_ml(self, idx: int) -> float:
+        ''' Returns the most an ingredient can be set to, rounded down to 0.1 ml. '''
+
+        return int((self.liquids[idx].ml + self.free_volume) * 10) / 10
+
+    # The properties of the mixture, like those of a fludo.Mixture of the liquids
+
+    @property
+    def pg(self) -> float:
+        return self.pg_ml / self.ml * 100 if self.ml > EMPTY_ML else 50
+
+    @property
+    def vg(self) -> float:
+        return self.vg_ml / self.ml * 100 if self.ml > EMPTY_ML else 50
+
+    @property
+    def nic(self) -> float:
+        return self.nic_mg / self.ml if self.ml > EMPTY_ML else 0
+
+    def mixture(self) -> fludo.Mixture:
+        ''' Returns the fludo.Mixture of the liquids. '''
+
+        return fludo.Mixture(*self.liquids)
+
+    def load(self, liquids: List[fludo.Liquid], bottle_vol: Union[int, float],
+            filler_idx: Optional[int] = None) -> None:
+        ''' Replaces every ingredient, the bottle volume and the filler, summing up once. '''
+
+        self.liquids = list(liquids)
+        self.bottle_vol = bottle_vol
+        self.filler_idx = filler_idx
+        self.recalculate()
+        self._refill()
+
+    def add(self, liquid: fludo.Liquid) -> int:
+        ''' Adds an ingredient and returns its index. '''
+
+        self.liquids.append(liquid)
+        self.recalculate()
+        self._refill()
+        return len(self.liquids) - 1
+
+    def remove(self, idx: int) -> fludo.Liquid:
+        ''' Removes an ingredient and returns its liquid. '''
+
+        if idx == self.filler_idx:
+            self.filler_idx = None
+        elif self.filler_idx is not None and idx < self.filler_idx:
+            self.filler_idx -= 1
+        liquid = self.liquids.pop(idx)
+        self.recalculate()
+        self._refill()
+        return liquid
+
+    def set_ml(self, idx: int, ml: Union[int, float]) -> None:
+        '''
+        Sets the volume of an ingredient in constant time. The filler's volume follows the
+        others, so setting it is ignored.
+        '''
+
+        if idx == self.filler_idx:
+            return
+        liquid = self.liquids[idx]
+        self._add_totals(liquid, -1)
+        liquid.update_ml(ml)
+        self._add_totals(liquid)
+        self._refill()
+
+    def set_volumes(self, volumes: List[Union[int, float]]) -> None:
+        ''' Sets the volume of every ingredient but the filler at once, summing up once. '''
+
+        for idx, (liquid, ml) in enumerate(zip(self.liquids, volumes)):
+            if idx != self.filler_idx:
+                liquid.update_ml(ml)
+        self.recalculate()
+        self._refill()
+
+    def set_liquid(self, idx: int, liquid: fludo.Liquid) -> None:
+        ''' Replaces the liquid of an ingredient, keeping the volume of the filler. '''
+
+        self._add_totals(self.liquids[idx], -1)
+        if idx == self.filler_idx:
+            liquid.update_ml(self.liquids[idx].ml)
+        self.liquids[idx] = liquid
+        self._add_totals(liquid)
+        self._refill()
+
+    def set_filler(self, idx: Optional[int]) -> None:
+        ''' Makes an ingredient fill up the bottle, or none with None. '''
+
+        self.filler_idx = idx
+        self._refill()
+
+    def set_bottle_volume(self, ml: Union[int, float]) -> None:
+        ''' Resizes the bottle, scaling the volume of every ingredient by the same ratio. '''
+
+        ratio = ml / self.bottle_vol
+        self.bottle_vol = ml
+        for idx, liquid in enumerate(self.liquids):
+            if idx != self.filler_idx:
+                liquid.update_ml(liquid.ml * ratio)
+        self.recalculate()
+        self._refill()
+
+    def _refill(self) -> None:
+        ''' Sets the volume of the filler to the free volume, rounded down to 0.1 ml. '''
+
+        if self.filler_idx is None:
+            return
+        liquid = self.liquids[self.filler_idx]
+        self._add_totals(liquid, -1)
+        liquid.update_ml(max(0.0, int((self.bottle_vol - self.ml) * 10) / 10))
+        self._add_totals(liquid)
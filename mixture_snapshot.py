@@ -0,0 +1,79 @@
+from collections import namedtuple
+from typing import Iterable, Union
+
+import fludo
+
+
+class IngredientSnapshot(namedtuple('IngredientSnapshot',
+        ['class_', 'name', 'ml', 'pg', 'vg', 'nic', 'cost_per_ml'])):
+    '''
+    Read-only record of a liquid in a MixtureSnapshot. It has the attributes of a fludo.Liquid
+    that BottleViewer reads, liquid() returns a new fludo.Liquid of it that can be edited.
+    '''
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, liquid: fludo.Liquid) -> 'IngredientSnapshot':
+        return cls(type(liquid), liquid.name, liquid.ml, liquid.pg, liquid.vg, liquid.nic,
+            liquid.cost_per_ml)
+
+    def liquid(self) -> fludo.Liquid:
+        # Like MixtureCodec.decode, without calling the __init__ of the fludo subclasses
+        liquid = self.class_.__new__(self.class_)
+        liquid.__dict__.update(name=self.name, pg=self.pg, vg=self.vg, nic=self.nic,
+            cost_per_ml=self.cost_per_ml)
+        liquid.update_ml(self.ml)
+        return liquid
+
+
+class MixtureSnapshot:
+    '''
+    Immutable Mixer dump (see Mixer.dump) that can be handed out as is instead of deep copying
+    a cached one. Its ingredients are a tuple of IngredientSnapshots.
+    BottleViewer shows it directly. Mixer.load copies it with dump(), as the Mixer edits the
+    liquids it's given.
+    '''
+
+    __slots__ = ('ingredients', 'bottle_vol', 'filler_idx', 'name', 'notes')
+
+    def __init__(self, ingredients: Iterable[IngredientSnapshot], bottle_vol: Union[int, float],
+            filler_idx: Union[int, None], name: str, notes: str):
+        for slot, value in zip(self.__slots__,
+                (tuple(ingredients), bottle_vol, filler_idx, name, notes)):
+            object.__setattr__(self, slot, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MixtureSnapshot is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('MixtureSnapshot is immutable.')
+
+    def __repr__(self):
+        return '<MixtureSnapshot ({}): {} ingredients>'.format(self.name, len(self.ingredients))
+
+    @classmethod
+    def of(cls, mixture_dict: dict) -> 'MixtureSnapshot':
+        ''' Returns the snapshot of a Mixer dump. The dump isn't copied or changed. '''
+
+        return cls([IngredientSnapshot.of(liquid) for liquid in mixture_dict['ingredients']],
+            mixture_dict['bottle_vol'], mixture_dict['filler_idx'], mixture_dict['name'],
+            mixture_dict['notes'])
+
+    def dump(self) -> dict:
+        ''' Returns the snapshot as a Mixer dump of new liquids, which can be edited. '''
+
+        return {
+            'ingredients': [ingredient.liquid() for ingredient in self.ingredients],
+            'bottle_vol': self.bottle_vol,
+            'filler_idx': self.filler_idx,
+            'name': self.name,
+            'notes': self.notes,
+        }
+
+
+def as_mixture(ingredients: Iterable[Union[fludo.Liquid, IngredientSnapshot]]) -> fludo.Mixture:
+    ''' Returns the fludo.Mixture of liquids and/or IngredientSnapshots. '''
+
+    return fludo.Mixture(*[ingredient.liquid() if isinstance(ingredient, IngredientSnapshot)
+        else ingredient for ingredient in ingredients])
@@ -0,0 +1,143 @@
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import fludo
+
+from mixture_snapshot import IngredientSnapshot
+
+SOLVE_RESOLUTION = 0.1  # ml the volumes are rounded to, like the scales of the Mixer
+VOLUME_WEIGHT = 1e3  # weight of filling the bottle against reaching the profile
+STAY_WEIGHT = 1e-6  # weight of keeping the start volumes, picks one of equally good recipes
+
+SolvedMixture = namedtuple('SolvedMixture', ['volumes', 'ml', 'pg', 'vg', 'nic'])
+
+
+def nnls(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    '''
+    Returns the x >= 0 minimizing ||a x - b||, with the active set method of Lawson and Hanson.
+    Every step solves a least squares problem of the ingredients that are used so far, which
+    is quick for the few columns a mixture has.
+    '''
+
+    rows, columns = a.shape
+    tolerance = 10 * np.finfo(float).eps * np.abs(a).sum(axis=0).max() * max(rows, columns)
+    x = np.zeros(columns)
+    used = np.zeros(columns, bool)
+    gradient = a.T @ b
+
+    for iteration in range(3 * columns):
+        if used.all() or gradient[~used].max() <= tolerance:
+            break
+        used[np.argmax(np.where(used, -np.inf, gradient))] = True
+
+        while True:
+            z = np.zeros(columns)
+            z[used] = np.linalg.lstsq(a[:, used], b, rcond=None)[0]
+            if (z[used] > tolerance).all():
+                break
+            # Step towards z until the first used x reaches 0, then stop using the ones at 0
+            shrinking = used & (z <= tolerance)
+            distance = x[shrinking] - z[shrinking]
+            moving = distance > 0
+            step = np.min(np.where(moving, x[shrinking] / np.where(moving, distance, 1), 0))
+            x += step * (z - x)
+            used &= x > tolerance
+            x[~used] = 0
+        x = z
+        gradient = a.T @ (b - a @ x)
+    return x
+
+
+def solve_mixture(liquids: Sequence[Union[fludo.Liquid, IngredientSnapshot]],
+        bottle_vol: Union[int, float], pg: float, vg: float, nic: float,
+        fixed: Optional[Dict[int, float]] = None, filler_idx: Optional[int] = None,
+        start: Optional[Sequence[float]] = None,
+        resolution: float = SOLVE_RESOLUTION) -> SolvedMixture:
+    '''
+    Works out the volumes of the liquids that mix to pg and vg percent and nic mg/ml in a bottle
+    of bottle_vol ml. Their PG, VG and nicotine are used, their volumes are not.
+
+    fixed maps the indices of liquids to the volumes they keep. The liquid of filler_idx fills
+    the bottle with what the others leave, like the filler of the Mixer. The volumes of the
+    others fill the bottle together without one, and are rounded to resolution ml. If there
+    are many recipes of the profile, the one closest to the start volumes is picked, which are
+    the volumes of the liquids unless given. When the liquids can't mix the profile, the
+    closest one they can is returned, so check the profile of the SolvedMixture.
+    Raises ValueError if the fixed volumes don't fit in the bottle.
+    '''
+
+    fixed = dict(fixed or {})
+    if filler_idx is not None and filler_idx in fixed:
+        raise ValueError('The volume of the filler can\'t be fixed, it fills the bottle.')
+    if pg < 0 or vg < 0 or pg + vg > 100:
+        raise ValueError('PG and VG have to be percentages adding up to 100 at most.')
+    free_vol = bottle_vol - sum(fixed.values())
+    if free_vol < 0:
+        raise ValueError('The fixed volumes exceed the bottle volume.')
+
+    properties = np.array([(liquid.pg, liquid.vg, liquid.nic) for liquid in liquids],
+        float).reshape(-1, 3)
+    volumes = np.zeros(len(properties))
+    for idx, ml in fixed.items():
+        volumes[idx] = ml
+    free = np.array([idx not in fixed for idx in range(len(properties))], bool)
+    if start is None:
+        start = [liquid.ml for liquid in liquids]
+
+    if free.any() and free_vol > 0:
+        # Rows of the least squares problem, in percent and mg/ml of the bottle. What the fixed
+        # liquids add is taken off the target.
+        target = np.array([pg, vg, nic], float) * bottle_vol - volumes @ properties
+        stay = np.sqrt(STAY_WEIGHT) * np.eye(int(free.sum()))
+        a = np.vstack([properties[free].T, np.sqrt(VOLUME_WEIGHT) * 100 * np.ones(free.sum()),
+            stay * 100]) / bottle_vol
+        b = np.concatenate([target, [np.sqrt(VOLUME_WEIGHT) * 100 * free_vol],
+            stay @ np.asarray(start, float)[free] * 100]) / bottle_vol
+        solved = nnls(a, b)
+        if solved.sum() > 0:
+            solved *= free_vol / solved.sum()  # the weighted row only gets close to it
+        volumes[free] = solved
+
+    # Round like the Mixer, the filler or else the largest volume takes up the difference
+    rounding = free.copy()
+    if filler_idx is not None:
+        rounding[filler_idx] = False
+    rounded = volumes.copy()
+    rounded[rounding] = round_keeping_sum(volumes[rounding], resolution)
+    if filler_idx is not None:
+        rounded[filler_idx] = 0
+        # rounded down to 0.1 ml, like MixtureModel fills the bottle
+        rounded[filler_idx] = max(0, int((bottle_vol - rounded.sum()) * 10) / 10)
+    elif free.any() and rounded.sum() > bottle_vol:
+        largest = np.argmax(np.where(free, rounded, -1))
+        excess = np.ceil((rounded.sum() - bottle_vol) / resolution - 1e-9) * resolution
+        rounded[largest] = max(0, rounded[largest] - excess)
+    volumes = [round(float(ml), 10) for ml in rounded]
+
+    return SolvedMixture(volumes, *mixed_profile(properties, volumes))
+
+
+def round_keeping_sum(volumes: np.ndarray, resolution: float) -> np.ndarray:
+    '''
+    Rounds volumes to resolution so that they add up to their sum rounded: they're rounded
+    down, then the ones that lost the most are rounded up instead. Rounding many similar
+    volumes one by one would shift the mixture in the same direction with each of them.
+    '''
+
+    units = volumes / resolution
+    rounded = np.floor(units)
+    missing = int(round(units.sum() - rounded.sum()))
+    rounded[np.argsort(rounded - units)[:missing]] += 1
+    return rounded * resolution
+
+
+def mixed_profile(properties: np.ndarray, volumes: List[float]) -> tuple:
+    ''' Returns the (ml, pg, vg, nic) of liquids of (pg, vg, nic) properties mixed in volumes. '''
+
+    volumes = np.asarray(volumes, float)
+    ml = volumes.sum()
+    if ml <= 0:
+        return 0.0, 50.0, 50.0, 0.0  # like an empty fludo.Mixture
+    pg, vg, nic = volumes @ properties / ml
+    return float(ml), float(pg), float(vg), float(nic)
@@ -0,0 +1,519 @@
+import struct
+import zlib
+import weakref
+from collections import namedtuple
+from typing import List, Optional
+
+import fludo
+
+from storage import ObjectStorage, PickleCodec
+from mixture_batch import MixtureBatch
+
+RECORD_MAGIC = b'ELQ'
+RECORD_VERSION = 1  # liquids stored in the record
+CATALOG_RECORD_VERSION = 2  # liquids referenced by their id in a LiquidCatalog
+NOTES_COMPRESS_MIN = 256  # notes shorter than this many bytes are never compressed
+UNLINKED = (-1, 0, 0.0)  # (position, liquid id, ml) of the link of a mixture that can't be linked
+
+MIXTURE_KEYS = {'ingredients', 'bottle_vol', 'filler_idx', 'name', 'notes'}
+HEAD_KEYS = {'bottle_vol', 'filler_idx', 'name', 'notes'}  # MIXTURE_KEYS before the ingredients
+LIQUID_FIELDS = ('ml', 'pg', 'vg', 'nic', 'cost_per_ml')
+LIQUID_ATTRIBUTES = {'name', 'total_cost', 'total_pgml', 'total_vgml', 'total_nicmg',
+    *LIQUID_FIELDS}
+
+CATALOG_FIELDS = ('pg', 'vg', 'nic', 'cost_per_ml')  # LIQUID_FIELDS that aren't per mixture
+
+MixtureSummary = namedtuple('MixtureSummary',
+    ['tag', 'name', 'pg', 'vg', 'nic', 'ml', 'bottle_vol', 'ingredient_count'])
+
+_liquid_classes = dict()
+
+
+def liquid_class(class_name: str) -> type:
+    ''' Returns the fludo class of a liquid by name, falling back to fludo.Liquid. '''
+
+    if class_name not in _liquid_classes:
+        class_ = getattr(fludo, class_name, None)
+        if (not isinstance(class_, type) or not issubclass(class_, fludo.Liquid)
+                or issubclass(class_, fludo.Mixture)):
+            class_ = fludo.Liquid
+        _liquid_classes[class_name] = class_
+    return _liquid_classes[class_name]
+
+
+class LiquidCatalog:
+    '''
+    The distinct liquids of a mixture table, kept in the {table}_liquids table. Mixture records
+    refer to liquids by their id, so a liquid used by any number of mixtures is stored once.
+    A liquid is its class, name, PG, VG, nicotine and cost per ml; the ml is per mixture.
+
+    Liquids are never removed from the catalog, so the ids known by a connection stay valid.
+    Ids added through other connections are read when first seen.
+    '''
+
+    def __init__(self, sqlite_connection, table_name: str):
+        self.sqlite_connection = sqlite_connection
+        self.table_name = table_name
+        self._ids = dict()  # (name, class name, *CATALOG_FIELDS, int mask): id
+        self._liquids = dict()  # id: (class, name, *CATALOG_FIELDS)
+        self._max_id = 0
+
+    def create_table(self) -> None:
+        self.sqlite_connection.execute('''CREATE TABLE IF NOT EXISTS {0}_liquids (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            class TEXT NOT NULL,
+            pg REAL NOT NULL,
+            vg REAL NOT NULL,
+            nic REAL NOT NULL,
+            cost_per_ml REAL NOT NULL,
+            int_mask INTEGER NOT NULL,
+            UNIQUE (name, class, pg, vg, nic, cost_per_ml, int_mask)
+        )'''.format(self.table_name))
+
+    @staticmethod
+    def _key(liquid: fludo.Liquid) -> tuple:
+        attributes = vars(liquid)
+        pg, vg, nic, cost_per_ml = (attributes['pg'], attributes['vg'], attributes['nic'],
+            attributes['cost_per_ml'])
+        int_mask = ((type(pg) is int) | (type(vg) is int) << 1 | (type(nic) is int) << 2 |
+            (type(cost_per_ml) is int) << 3)
+        return (attributes['name'], type(liquid).__name__, pg, vg, nic, cost_per_ml, int_mask)
+
+    def _read(self, rows) -> None:
+        for id_, name, class_name, *values, int_mask in rows:
+            values = [int(value) if int_mask & (1 << bit) else value
+                for bit, value in enumerate(values)]
+            self._ids[(name, class_name, *values, int_mask)] = id_
+            self._liquids[id_] = (liquid_class(class_name), name, *values)
+            self._max_id = max(self._max_id, id_)
+
+    def liquid_id(self, liquid: fludo.Liquid) -> int:
+        ''' Returns the id of a liquid, adding it to the catalog if it's not in there yet. '''
+
+        key = self._key(liquid)
+        if key not in self._ids:
+            # Part of the caller's transaction, see forget()
+            self.sqlite_connection.execute(('INSERT OR IGNORE INTO {0}_liquids (name, class, pg, '
+                'vg, nic, cost_per_ml, int_mask) VALUES (?, ?, ?, ?, ?, ?, ?)').format(
+                    self.table_name), key)
+            self._read(self.sqlite_connection.execute(('SELECT id, name, class, pg, vg, nic, '
+                'cost_per_ml, int_mask FROM {0}_liquids WHERE name=? AND class=? AND pg=? AND vg=? '
+                'AND nic=? AND cost_per_ml=? AND int_mask=?').format(self.table_name), key))
+        return self._ids[key]
+
+    def liquid(self, id_: int) -> tuple:
+        ''' Returns the (class, name, *CATALOG_FIELDS) of a liquid by its id. '''
+
+        if id_ not in self._liquids:
+            self._read(self.sqlite_connection.execute(('SELECT id, name, class, pg, vg, nic, '
+                'cost_per_ml, int_mask FROM {0}_liquids WHERE id > ?').format(self.table_name),
+                (self._max_id, )))
+            if id_ not in self._liquids:
+                raise ValueError('Liquid {} is missing from the catalog.'.format(id_))
+        return self._liquids[id_]
+
+    def forget(self) -> None:
+        ''' Forgets every id, as some might be of liquids whose adding was rolled back. '''
+
+        self._ids.clear()
+        self._liquids.clear()
+        self._max_id = 0
+
+
+class MixtureCodec(PickleCodec):
+    '''
+    Encodes Mixer dumps in a compact binary record instead of a pickle. Liquids are stored as
+    their class name, name and five numbers, so no module paths or attribute names are repeated.
+    Long notes are zlib compressed. Anything the record can't represent exactly is pickled as
+    before, and pickles are still decoded.
+
+    Record (version 1, little-endian):
+        header      3s magic, B version, B flags, d bottle_vol, H filler_idx, H ingredient count
+        name        H length, utf-8
+        notes       I length, utf-8 (zlib compressed if flags & NOTES_COMPRESSED)
+        ingredient  B length, class name; H length, utf-8 name; B int mask; 5d LIQUID_FIELDS
+
+    With a LiquidCatalog, version 2 records are written instead, whose ingredients refer to the
+    catalog. Their header, name and notes are the same as in version 1.
+        ingredient  I liquid id, B 1 if ml is an int, d ml
+
+    replace() rewrites only the header, name and notes of a record and keeps its ingredients.
+    '''
+
+    NOTES_COMPRESSED = 1
+    BOTTLE_VOL_INT = 2
+    NO_FILLER = 0xFFFF
+
+    _header = struct.Struct('<3sBBdHH')
+    _short_length = struct.Struct('<B')
+    _length = struct.Struct('<H')
+    _long_length = struct.Struct('<I')
+    _liquid_fields = struct.Struct('<B5d')
+    _catalog_ingredient = struct.Struct('<IBd')
+
+    def __init__(self, catalog: Optional[LiquidCatalog] = None):
+        self.catalog = catalog
+
+    def encodable(self, mixture_dict) -> bool:
+        ''' Tells whether the record can hold everything in the object. '''
+
+        if type(mixture_dict) is not dict or set(mixture_dict) != MIXTURE_KEYS:
+            return False
+        if (not self._head_encodable(mixture_dict) or
+                type(mixture_dict['ingredients']) is not list or
+                len(mixture_dict['ingredients']) >= self.NO_FILLER):
+            return False
+        for liquid in mixture_dict['ingredients']:
+            attributes = vars(liquid)
+            if (liquid_class(type(liquid).__name__) is not type(liquid) or
+                    attributes.keys() != LIQUID_ATTRIBUTES or type(liquid.name) is not str):
+                return False
+            for field in LIQUID_FIELDS:
+                if type(attributes[field]) is not float and type(attributes[field]) is not int:
+                    return False
+        return True
+
+    def _head_encodable(self, head: dict) -> bool:
+        if (type(head['name']) is not str or type(head['notes']) is not str or
+                type(head['bottle_vol']) not in (int, float)):
+            return False
+        return head['filler_idx'] is None or (type(head['filler_idx']) is int and
+            0 <= head['filler_idx'] < self.NO_FILLER)
+
+    def _head(self, version: int, mixture_dict: dict, ingredient_count: int) -> list:
+        ''' Returns the parts of a record before the ingredients. '''
+
+        flags = 0
+        notes = mixture_dict['notes'].encode('utf-8')
+        if len(notes) >= NOTES_COMPRESS_MIN:
+            compressed_notes = zlib.compress(notes)
+            if len(compressed_notes) < len(notes):
+                notes = compressed_notes
+                flags |= self.NOTES_COMPRESSED
+        if type(mixture_dict['bottle_vol']) is int:
+            flags |= self.BOTTLE_VOL_INT
+        name = mixture_dict['name'].encode('utf-8')
+
+        return [
+            self._header.pack(RECORD_MAGIC, version, flags, mixture_dict['bottle_vol'],
+                self.NO_FILLER if mixture_dict['filler_idx'] is None
+                    else mixture_dict['filler_idx'],
+                ingredient_count),
+            self._length.pack(len(name)), name,
+            self._long_length.pack(len(notes)), notes,
+        ]
+
+    def encode(self, mixture_dict: dict) -> bytes:
+        if not self.encodable(mixture_dict):
+            return super().encode(mixture_dict)
+
+        parts = self._head(RECORD_VERSION if self.catalog is None else CATALOG_RECORD_VERSION,
+            mixture_dict, len(mixture_dict['ingredients']))
+        if self.catalog is not None:
+            parts += [self._catalog_ingredient.pack(self.catalog.liquid_id(liquid),
+                    type(liquid.ml) is int, liquid.ml)
+                for liquid in mixture_dict['ingredients']]
+            return b''.join(parts)
+        for liquid in mixture_dict['ingredients']:
+            class_name = type(liquid).__name__.encode('ascii')
+            liquid_name = liquid.name.encode('utf-8')
+            values = [getattr(liquid, field) for field in LIQUID_FIELDS]
+            int_mask = sum(1 << bit for bit, value in enumerate(values) if type(value) is int)
+            parts += [
+                self._short_length.pack(len(class_name)), class_name,
+                self._length.pack(len(liquid_name)), liquid_name,
+                self._liquid_fields.pack(int_mask, *values),
+            ]
+        return b''.join(parts)
+
+    def _read_head(self, data: bytes) -> tuple:
+        ''' Returns the version, head fields, ingredient count and ingredients offset of a record. '''
+
+        magic, version, flags, bottle_vol, filler_idx, ingredient_count = \
+            self._header.unpack_from(data)
+        if version not in (RECORD_VERSION, CATALOG_RECORD_VERSION):
+            raise ValueError('Unsupported mixture record version: {}'.format(version))
+        offset = self._header.size
+
+        length, = self._length.unpack_from(data, offset)
+        offset += self._length.size
+        name = data[offset:offset + length].decode('utf-8')
+        offset += length
+
+        length, = self._long_length.unpack_from(data, offset)
+        offset += self._long_length.size
+        notes = data[offset:offset + length]
+        offset += length
+        if flags & self.NOTES_COMPRESSED:
+            notes = zlib.decompress(notes)
+
+        return version, {
+            'bottle_vol': int(bottle_vol) if flags & self.BOTTLE_VOL_INT else bottle_vol,
+            'filler_idx': None if filler_idx == self.NO_FILLER else filler_idx,
+            'name': name,
+            'notes': notes.decode('utf-8'),
+        }, ingredient_count, offset
+
+    def replace(self, data: bytes, changes: dict) -> bytes:
+        if data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            # Pickled mixtures stay pickles, like they would if they were stored again
+            mixture_dict = super().decode(data)
+            mixture_dict.update(changes)
+            return super().encode(mixture_dict)
+        if not changes.keys() <= HEAD_KEYS:
+            return super().replace(data, changes)
+
+        version, head, ingredient_count, offset = self._read_head(data)
+        head.update(changes)
+        if not self._head_encodable(head):
+            return super().replace(data, changes)
+        # The ingredients are the same bytes in either version
+        return b''.join(self._head(version, head, ingredient_count)) + data[offset:]
+
+    def decode(self, data: bytes) -> dict:
+        if data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            return super().decode(data)
+
+        version, mixture_dict, ingredient_count, offset = self._read_head(data)
+        if version == CATALOG_RECORD_VERSION and self.catalog is None:
+            raise ValueError('Decoding a version 2 mixture record needs a LiquidCatalog.')
+
+        ingredients = []
+        for idx in range(ingredient_count):  # pylint: disable=W0612
+            if version == CATALOG_RECORD_VERSION:
+                liquid_id, ml_is_int, ml = self._catalog_ingredient.unpack_from(data, offset)
+                offset += self._catalog_ingredient.size
+                class_, liquid_name, pg, vg, nic, cost_per_ml = self.catalog.liquid(liquid_id)
+                ingredients.append(self._liquid(class_, liquid_name,
+                    int(ml) if ml_is_int else ml, pg, vg, nic, cost_per_ml))
+                continue
+
+            length, = self._short_length.unpack_from(data, offset)
+            offset += self._short_length.size
+            class_ = liquid_class(data[offset:offset + length].decode('ascii'))
+            offset += length
+
+            length, = self._length.unpack_from(data, offset)
+            offset += self._length.size
+            liquid_name = data[offset:offset + length].decode('utf-8')
+            offset += length
+
+            int_mask, ml, pg, vg, nic, cost_per_ml = self._liquid_fields.unpack_from(data, offset)
+            offset += self._liquid_fields.size
+            if int_mask:
+                ml, pg, vg, nic, cost_per_ml = [int(value) if int_mask & (1 << bit) else value
+                    for bit, value in enumerate((ml, pg, vg, nic, cost_per_ml))]
+
+            ingredients.append(self._liquid(class_, liquid_name, ml, pg, vg, nic, cost_per_ml))
+
+        mixture_dict['ingredients'] = ingredients
+        return mixture_dict
+
+    @staticmethod
+    def _liquid(class_: type, name: str, ml, pg, vg, nic, cost_per_ml) -> fludo.Liquid:
+        # Restore the liquid the way unpickling does, without calling __init__.
+        # The totals are calculated just like in fludo.Liquid.update_ml.
+        liquid = class_.__new__(class_)
+        liquid.__dict__.update({
+            'ml': ml,
+            'cost_per_ml': cost_per_ml,
+            'nic': nic,
+            'pg': pg,
+            'vg': vg,
+            'total_cost': ml * cost_per_ml,
+            'total_pgml': ml * (pg / 100),
+            'total_vgml': ml * (vg / 100),
+            'total_nicmg': nic * ml,
+            'name': name,
+        })
+        return liquid
+
+
+class MixtureStorage(ObjectStorage):
+    '''
+    ObjectStorage of Mixer dumps (see Mixer.dump) that also keeps the name, PG/VG ratio,
+    nicotine strength, volume, bottle volume and number of ingredients of every mixture in
+    indexed columns. The Library can list mixtures from these without unpickling any of them.
+    Mixture names, ingredient names and notes are full-text indexed for searching.
+    Mixtures are stored as compact MixtureCodec records, older pickled ones are read as well.
+    Opened mixtures are cached, see ObjectStorage.
+
+    Liquids are kept once in the LiquidCatalog of the table, which the records refer to.
+    The {table}_ingredients table links every mixture to its liquids and their ml, so that
+    tags_using() finds the mixtures using a liquid with an index lookup. Mixtures stored before
+    the catalog existed are converted when the table is opened the first time.
+    '''
+
+    cache_items = 256
+
+    summary_columns = (
+        ('name', 'TEXT'),
+        ('pg', 'REAL'),
+        ('vg', 'REAL'),
+        ('nic', 'REAL'),
+        ('ml', 'REAL'),
+        ('bottle_vol', 'REAL'),
+        ('ingredient_count', 'INTEGER'),
+    )
+    search_columns = ('name', 'ingredients', 'notes')
+
+    _catalogs = weakref.WeakKeyDictionary()  # SharedConnection: {table name: LiquidCatalog}
+
+    def __init__(self, sqlite_db_path: str, table_name: str, *args, **kwargs):
+        table = self._scrub_table_name(table_name)
+        self._ingredient_sql = {
+            'unlink': ('DELETE FROM {0}_ingredients WHERE mixture_id IN '
+                       '(SELECT id FROM {0} WHERE tag=?)').format(table),
+            'link': ('INSERT INTO {0}_ingredients (position, liquid_id, ml, mixture_id) '
+                     'SELECT ?, ?, ?, id FROM {0} WHERE tag=?').format(table),
+            'link_id': ('INSERT OR REPLACE INTO {0}_ingredients (position, liquid_id, ml, mixture_id) '
+                        'VALUES (?, ?, ?, ?)').format(table),
+            'copy_links': ('INSERT INTO {0}_ingredients (mixture_id, position, liquid_id, ml) '
+                           'SELECT (SELECT id FROM {0} WHERE tag=?), position, liquid_id, ml '
+                           'FROM {0}_ingredients WHERE mixture_id IN '
+                           '(SELECT id FROM {0} WHERE tag=?)').format(table),
+            'tags_using': ('SELECT {0}.tag FROM {0}_liquids '
+                           'JOIN {0}_ingredients ON {0}_ingredients.liquid_id = {0}_liquids.id '
+                           'JOIN {0} ON {0}.id = {0}_ingredients.mixture_id '
+                           'WHERE {0}_liquids.name=? GROUP BY {0}.id ORDER BY {0}.id').format(table),
+        }
+        self._codec = None
+        super().__init__(sqlite_db_path, table_name, *args, **kwargs)
+
+    @property
+    def codec(self) -> MixtureCodec:
+        ''' Writes records referring to the liquid catalog of the table on this connection. '''
+
+        if self._codec is None:
+            catalogs = self._catalogs.setdefault(self._shared, dict())
+            if self.table_name not in catalogs:
+                catalogs[self.table_name] = LiquidCatalog(self.sqlite_connection, self.table_name)
+            self._codec = MixtureCodec(catalogs[self.table_name])
+        return self._codec
+
+    def create_table(self) -> None:
+        self.codec.catalog.create_table()  # before the backfills of ObjectStorage decode anything
+        super().create_table()
+        self.sqlite_cursor.execute('''CREATE TABLE IF NOT EXISTS {0}_ingredients (
+            mixture_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            liquid_id INTEGER NOT NULL,
+            ml REAL NOT NULL,
+            PRIMARY KEY (mixture_id, position)
+        ) WITHOUT ROWID'''.format(self.table_name))
+        self.sqlite_cursor.execute(
+            'CREATE INDEX IF NOT EXISTS {0}_ingredients_liquid_idx ON {0}_ingredients (liquid_id)'
+                .format(self.table_name))
+        # Deleting mixtures in any way, even through a plain ObjectStorage, unlinks their liquids
+        self.sqlite_cursor.execute(('CREATE TRIGGER IF NOT EXISTS {0}_unlink AFTER DELETE ON {0} '
+            'BEGIN DELETE FROM {0}_ingredients WHERE mixture_id = old.id; END').format(
+                self.table_name))
+        self._backfill_ingredients()
+
+    def _backfill_ingredients(self) -> None:
+        '''
+        Converts mixtures stored before the catalog existed: their liquids are added to the
+        catalog, their records rewritten to refer to it and the links to their liquids added.
+        '''
+
+        rows = self.sqlite_cursor.execute(('SELECT id, object FROM {0} WHERE substr(object, 1, 4) = ? '
+            'OR (ingredient_count > 0 AND id NOT IN (SELECT mixture_id FROM {0}_ingredients))').format(
+                self.table_name), (RECORD_MAGIC + bytes([RECORD_VERSION]), )).fetchall()
+        if not rows:
+            return
+
+        records, links = [], []
+        for id_, object_ in rows:
+            mixture_dict = self.codec.decode(object_)
+            if self.codec.encodable(mixture_dict):
+                records.append((self.codec.encode(mixture_dict), id_))
+            links += [(*link, id_) for link in self._ingredient_links(mixture_dict)]
+
+        with self.transaction():
+            self.sqlite_cursor.executemany('UPDATE {0} SET object=? WHERE id=?'.format(
+                self.table_name), records)
+            self.sqlite_cursor.executemany(self._ingredient_sql['link_id'], links)
+
+    def _ingredient_links(self, mixture_dict: dict) -> list:
+        '''
+        Returns (position, liquid id, ml) of each ingredient of a mixture. A mixture the codec
+        can't encode gets the single UNLINKED link to no liquid instead, which tells
+        _backfill_ingredients that it has been looked at already.
+        '''
+
+        if not self.codec.encodable(mixture_dict):
+            return [UNLINKED]
+        return [(position, self.codec.catalog.liquid_id(liquid), liquid.ml)
+            for position, liquid in enumerate(mixture_dict['ingredients'])]
+
+    def _stored(self, tag: str, mixture_dict: dict) -> None:
+        self.sqlite_cursor.execute(self._ingredient_sql['unlink'], (tag, ))
+        self.sqlite_cursor.executemany(self._ingredient_sql['link'],
+            ((*link, tag) for link in self._ingredient_links(mixture_dict)))
+
+    def _copied(self, src_tag: str, dst_tag: str) -> None:
+        self.sqlite_cursor.execute(self._ingredient_sql['copy_links'], (dst_tag, src_tag))
+
+    def copied_columns(self, overrides: dict) -> Optional[dict]:
+        # The head keys are stored in columns of the same name, the rest come from the ingredients
+        return dict(overrides) if overrides.keys() <= HEAD_KEYS else None
+
+    def _rolled_back(self) -> None:
+        self.codec.catalog.forget()
+
+    def delete_all(self) -> None:
+        with self.transaction():
+            self.sqlite_cursor.execute('DROP TABLE IF EXISTS {0}_ingredients'.format(
+                self.table_name))
+            super().delete_all()
+
+    def tags_using(self, liquid_name: str) -> List[str]:
+        ''' Return the tags of the mixtures with an ingredient named liquid_name, in stored order. '''
+
+        return [row[0] for row in self.sqlite_connection.execute(
+            self._ingredient_sql['tags_using'], (liquid_name, ))]
+
+    def summarize(self, mixture_dict: dict) -> tuple:
+        return self.summarize_many([mixture_dict])[0]
+
+    def summarize_many(self, mixture_dicts: List[dict]) -> List[tuple]:
+        # The numbers of a fludo.Mixture of the ingredients, worked out for all of them at once
+        return [(
+            mixture_dict.get('name', ''),
+            pg,
+            vg,
+            nic,
+            ml,
+            mixture_dict['bottle_vol'],
+            len(mixture_dict['ingredients']),
+        ) for mixture_dict, (ml, pg, vg, nic, cost) in zip(mixture_dicts,
+            MixtureBatch.of_dicts(mixture_dicts).rows())]
+
+    def search_text(self, mixture_dict: dict) -> tuple:
+        return (
+            mixture_dict.get('name', ''),
+            ' '.join(liquid.name for liquid in mixture_dict['ingredients']),
+            mixture_dict.get('notes', ''),
+        )
+
+    def get_summaries(self, search: Optional[str] = None, order_by: Optional[str] = None,
+            descending: bool = False) -> List[MixtureSummary]:
+        '''
+        Return the MixtureSummary of every stored mixture in the order they were stored, or sorted
+        by the summary column order_by. If search is given, only mixtures whose name, ingredients
+        or notes match it are returned.
+        '''
+
+        return [MixtureSummary._make(row)
+            for row in super().get_summaries(search, order_by, descending)]
+
+    def get_summaries_page(self, limit: int, after: Optional[str] = None,
+            before: Optional[str] = None, search: Optional[str] = None,
+            order_by: Optional[str] = None, descending: bool = False) -> List[MixtureSummary]:
+        return [MixtureSummary._make(row) for row in super().get_summaries_page(
+            limit, after, before, search, order_by, descending)]
+
+    def get_summary(self, tag: str) -> Optional[MixtureSummary]:
+        row = super().get_summary(tag)
+        return MixtureSummary._make(row) if row is not None else None
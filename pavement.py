@@ -18,7 +18,7 @@ options(
     virtualenv=Bunch(
         script_name='bootstrap.py',
         dest_dir='build_venv',
-        packages_to_install=['fludo', 'PyInstaller']
+        packages_to_install=['fludo', 'numpy', 'PyInstaller']
     ),
     setup=Bunch(
         name="Eliq",
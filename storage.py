@@ -1,26 +1,455 @@
+import os
+import time
+import sys
+import queue
+import bisect
 import pickle
 import sqlite3
-from typing import Any
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+CACHED_STATEMENTS = 256
+MAX_QUERY_VARIABLES = 500  # stays well below SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds
+SUMMARY_BATCH = 1000  # objects summarized together when backfilling the summary columns
+
+_NOT_CACHED = object()
+
+
+class SharedConnection:
+    '''
+    One long-lived sqlite connection along with what has been set up on it already, so that
+    every ObjectStorage on the same database can skip reconnecting and re-creating its table.
+    '''
+
+    def __init__(self, sqlite_db_path: str):
+        self.sqlite_db_path = sqlite_db_path
+        self.connection = sqlite3.connect(sqlite_db_path, cached_statements=CACHED_STATEMENTS)
+        # Readers don't block the commits of the background writer, nor it them, in WAL mode
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.tables = set()  # (table name, summary columns) already set up on this connection
+        self.transaction_depth = 0  # commits are deferred while inside ObjectStorage.transaction
+        self.caches = dict()  # ObjectCache of each table, if caching is enabled for it
+        self.pending_changes = []  # (storage, event, tag) to announce once committed
+
+    def data_version(self) -> int:
+        ''' Returns a number that changes whenever another connection commits to the database. '''
+
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+
+class ConnectionRegistry:
+    '''
+    Keeps one connection per database file and thread for the whole session.
+    sqlite connections can't be shared between threads, hence the thread is part of the key.
+    Counters show how many connections were actually opened versus reused.
+    '''
+
+    def __init__(self):
+        self._connections = dict()
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reuses = 0
+        self.closes = 0
+
+    @staticmethod
+    def _key(sqlite_db_path: str) -> tuple:
+        if sqlite_db_path != ':memory:':
+            sqlite_db_path = os.path.abspath(sqlite_db_path)
+        return (sqlite_db_path, threading.get_ident())
+
+    def acquire(self, sqlite_db_path: str) -> SharedConnection:
+        ''' Returns the shared connection to the database, connecting only the first time. '''
+
+        key = self._key(sqlite_db_path)
+        with self._lock:
+            if key in self._connections:
+                self.reuses += 1
+            else:
+                self._connections[key] = SharedConnection(sqlite_db_path)
+                self.connects += 1
+            return self._connections[key]
+
+    def close(self, sqlite_db_path: str) -> None:
+        ''' Closes the calling thread's connection to the database if there is one. '''
+
+        with self._lock:
+            shared = self._connections.pop(self._key(sqlite_db_path), None)
+            if shared is not None:
+                shared.connection.close()
+                self.closes += 1
+
+    def close_all(self) -> None:
+        '''
+        Closes every connection of the calling thread. Call it when the application exits.
+        Connections of other threads can only be closed by them and are left alone.
+        '''
+
+        thread = threading.get_ident()
+        with self._lock:
+            for key in [key for key in self._connections if key[1] == thread]:
+                self._connections.pop(key).connection.close()
+                self.closes += 1
+
+    def stats(self) -> dict:
+        ''' Returns the connection counters of the session. '''
+
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'reuses': self.reuses,
+                'closes': self.closes,
+                'open': len(self._connections),
+            }
+
+
+connection_registry = ConnectionRegistry()
+
+
+class PickleCodec:
+    '''
+    Turns objects into the bytes stored by ObjectStorage and back, using pickle protocol 4.
+    Other codecs can replace it for specific kinds of objects. They should keep decoding pickles
+    so that objects stored earlier can still be read.
+    '''
+
+    def encode(self, object_: Any) -> bytes:
+        return pickle.dumps(object_, protocol=4)
+
+    def replace(self, data: bytes, changes: dict) -> bytes:
+        ''' Returns data, an encoded dict, with the values of some keys replaced by changes. '''
+
+        object_ = self.decode(data)
+        object_.update(changes)
+        return self.encode(object_)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class ObjectCache:
+    '''
+    LRU cache of unpickled objects, limited by number of objects and/or their pickled size.
+    Entries remember the row version they were read at and the connection's data_version when
+    that was last confirmed. After another connection commits, an entry is only reused if its
+    row version is still current.
+    '''
+
+    def __init__(self, max_items: int = 0, max_bytes: int = 0):
+        self.max_items = max_items  # 0 means unlimited
+        self.max_bytes = max_bytes  # 0 means unlimited
+        self._entries = OrderedDict()  # tag: [row version, data_version, object, size]
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self._entries
+
+    def lookup(self, tag: str) -> Optional[list]:
+        ''' Returns the entry of a tag and marks it as recently used. None if not cached. '''
+
+        entry = self._entries.get(tag)
+        if entry is not None:
+            self._entries.move_to_end(tag)
+        return entry
+
+    def put(self, tag: str, version: int, data_version: int, object_: Any, size: int) -> None:
+        self.discard(tag)
+        self._entries[tag] = [version, data_version, object_, size]
+        self._bytes += size
+
+        while self._entries and ((self.max_items and len(self._entries) > self.max_items) or
+                (self.max_bytes and self._bytes > self.max_bytes)):
+            tag, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[3]
+            self.evictions += 1
+
+    def discard(self, tag: str) -> None:
+        entry = self._entries.pop(tag, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'items': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+
+class LazyObject:
+    ''' A stored object that is only decoded when its value is first accessed. '''
+
+    __slots__ = ('_data', '_decode', '_object')
+
+    _NOT_LOADED = object()
+
+    def __init__(self, data: bytes, decode: Callable[[bytes], Any] = pickle.loads):
+        self._data = data
+        self._decode = decode
+        self._object = self._NOT_LOADED
+
+    @property
+    def loaded(self) -> bool:
+        return self._object is not self._NOT_LOADED
+
+    @property
+    def value(self) -> Any:
+        if self._object is self._NOT_LOADED:
+            self._object = self._decode(self._data)
+            self._data = None  # the encoded object isn't needed anymore
+        return self._object
+
+
+class StoredObjectDict(Mapping):
+    '''
+    Read-only dict of the given tags to their objects in an ObjectStorage.
+    An object is only read from the database and decoded when it's looked up.
+    '''
+
+    def __init__(self, storage: 'ObjectStorage', tags: Iterable[str]):
+        self._storage = storage
+        self._tags = dict.fromkeys(tags)  # ordered, with fast membership tests
+
+    def __getitem__(self, tag: str) -> Any:
+        if tag not in self._tags:
+            raise KeyError(tag)
+        return self._storage.get(tag)
+
+    def __contains__(self, tag: object) -> bool:
+        return tag in self._tags
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._tags)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def add(self, tag: str) -> None:
+        ''' Adds a tag that was stored since the dict was made. '''
+
+        self._tags[tag] = None
+
+    def discard(self, tag: str) -> None:
+        ''' Removes a tag that was deleted since the dict was made. '''
+
+        self._tags.pop(tag, None)
 
 
 class ObjectStorage:
     '''
     Simple class that stores pickled (serialized) python objects as in an sqlite database table.
+    Subclasses can serialize with a different codec than PickleCodec.
     It can retrieve the stored objects by their tags directly as python objects.
     Objects are referenced with unique tags.
+    Instances on the same database share one connection from the connection_registry, so they
+    are cheap to create. SQL statements are formatted once per instance so that sqlite's
+    statement cache can reuse the prepared statements.
+
+    Subclasses can keep a summary of every object in indexed columns next to the pickle by
+    defining summary_columns and summarize(). Summaries can be listed without unpickling.
+    Likewise they can define search_columns and search_text() to keep a full-text index
+    (sqlite FTS5) of the objects, which search() and get_summaries(search=...) query.
+
+    Unpickled objects can be kept in an ObjectCache shared by all storages of the table, enabled
+    with cache_items and/or cache_bytes. Cached objects are handed out to every caller as is, so
+    copy them before making changes.
     '''
 
-    def __init__(self, sqlite_db_path: str, table_name: str):
+    codec = PickleCodec()
+    summary_columns = ()  # (column name, sqlite type) pairs, values come from summarize()
+    search_columns = ()  # full-text indexed column names, values come from search_text()
+    cache_items = 0  # max number of cached objects, used if not given to the constructor
+    cache_bytes = 0  # max pickled size of cached objects, used if not given to the constructor
+
+    def __init__(self, sqlite_db_path: str, table_name: str,
+            cache_items: Optional[int] = None, cache_bytes: Optional[int] = None):
         self.sqlite_db_path = sqlite_db_path
         self.table_name = self._scrub_table_name(table_name)
 
-        self.sqlite_connection = sqlite3.connect(self.sqlite_db_path)
+        self._shared = connection_registry.acquire(self.sqlite_db_path)
+        self.sqlite_connection = self._shared.connection
         self.sqlite_cursor = self.sqlite_connection.cursor()
-        
-        self.create_table()
+        self._listeners = []
+
+        columns = ''.join(', ' + self._scrub_table_name(name)
+            for name, type_ in self.summary_columns)
+        placeholders = ', ?' * len(self.summary_columns)
+        self._sql = {
+            # New rows get a random version, so a row that is deleted and stored again by another
+            # connection can't be mistaken for the cached one.
+            'store': 'INSERT INTO {0} (tag, object, version{1}) VALUES (?, ?, random(){2})'.format(
+                self.table_name, columns, placeholders),
+            'upsert': ('INSERT INTO {0} (tag, object, version{1}) VALUES (?, ?, random(){2}) '
+                       'ON CONFLICT(tag) DO UPDATE SET object=excluded.object, '
+                       'version=version+1{3}').format(
+                           self.table_name, columns, placeholders,
+                           ''.join(', {0}=excluded.{0}'.format(name)
+                               for name, type_ in self.summary_columns)),
+            'get': 'SELECT id, tag, object, version FROM {0} WHERE tag=?'.format(self.table_name),
+            'get_many': 'SELECT id, tag, object, version FROM {0} WHERE tag IN ({{0}})'.format(
+                self.table_name),
+            'version': 'SELECT version FROM {0} WHERE tag=?'.format(self.table_name),
+            'get_all': 'SELECT id, tag, object FROM {0}'.format(self.table_name),
+            'tags': 'SELECT tag FROM {0}'.format(self.table_name),
+            'summaries': 'SELECT tag{1} FROM {0} ORDER BY {{0}}'.format(self.table_name, columns),
+            'summary': 'SELECT tag{1} FROM {0} WHERE tag=?'.format(self.table_name, columns),
+            'summaries_page': 'SELECT tag{1} FROM {0} WHERE {{0}} ORDER BY {{1}} LIMIT ?'.format(
+                self.table_name, columns),
+            'ordered_tags': 'SELECT tag FROM {0} ORDER BY {{0}}'.format(self.table_name),
+            'after_key': '({{0}}) {{1}} (SELECT {{2}} FROM {0} WHERE tag=?)'.format(self.table_name),
+            # Row values compare like the ORDER BY of the same columns, using the same index
+            'position': ('SELECT COUNT(*) FROM {0} WHERE ({{0}}, id) {{1}} '
+                         '(SELECT {{0}}, id FROM {0} WHERE tag=?)').format(self.table_name),
+            'object': 'SELECT object FROM {0} WHERE tag=?'.format(self.table_name),
+            # The object and summary columns are either copied or given, see copy()
+            'copy': ('INSERT INTO {0} (tag, object, version{1}) '
+                     'SELECT ?, {{0}}, random(){{1}} FROM {0} WHERE tag=?').format(
+                         self.table_name, columns),
+            'delete': 'DELETE FROM {0} WHERE tag=?'.format(self.table_name),
+        }
+        if self.search_columns:
+            search_table = '{0}_search'.format(self.table_name)
+            self._sql.update({
+                'index': 'INSERT INTO {0} (rowid, {1}) SELECT id, {2} FROM {3} WHERE tag=?'.format(
+                    search_table,
+                    ', '.join(self._scrub_table_name(name) for name in self.search_columns),
+                    ', '.join('?' * len(self.search_columns)), self.table_name),
+                'unindex': 'DELETE FROM {0} WHERE rowid IN (SELECT id FROM {1} WHERE tag=?)'.format(
+                    search_table, self.table_name),
+                'copy_index': ('INSERT INTO {0} (rowid, {2}) SELECT '
+                               '(SELECT id FROM {1} WHERE tag=?), {{0}} FROM {0} '
+                               'WHERE rowid IN (SELECT id FROM {1} WHERE tag=?)').format(
+                                   search_table, self.table_name,
+                                   ', '.join(self._scrub_table_name(name)
+                                       for name in self.search_columns)),
+                'search': ('SELECT {1}.tag FROM {0} JOIN {1} ON {1}.id = {0}.rowid '
+                           'WHERE {0} MATCH ? ORDER BY {0}.rowid LIMIT ?').format(
+                               search_table, self.table_name),
+                'search_summaries': ('SELECT {1}.tag{2} FROM {0} JOIN {1} ON {1}.id = {0}.rowid '
+                                     'WHERE {0} MATCH ? ORDER BY {{0}}').format(
+                                         search_table, self.table_name,
+                                         ''.join(', {0}.{1}'.format(self.table_name, name)
+                                             for name, type_ in self.summary_columns)),
+                'search_summaries_page': ('SELECT {1}.tag{2} FROM {0} JOIN {1} '
+                                          'ON {1}.id = {0}.rowid WHERE {0} MATCH ? AND {{0}} '
+                                          'ORDER BY {{1}} LIMIT ?').format(
+                                              search_table, self.table_name,
+                                              ''.join(', {0}.{1}'.format(self.table_name, name)
+                                                  for name, type_ in self.summary_columns)),
+            })
+
+        # Storages with different extra columns on the same table each need to set them up.
+        self._table_key = (self.table_name, self.summary_columns, self.search_columns)
+        if self._table_key not in self._shared.tables:
+            self.create_table()
+
+        cache_items = self.cache_items if cache_items is None else cache_items
+        cache_bytes = self.cache_bytes if cache_bytes is None else cache_bytes
+        if cache_items or cache_bytes:
+            if self.table_name not in self._shared.caches:
+                self._shared.caches[self.table_name] = ObjectCache(cache_items, cache_bytes)
+            else:
+                self._shared.caches[self.table_name].max_items = cache_items
+                self._shared.caches[self.table_name].max_bytes = cache_bytes
     
-    def __del__(self):
-        self.sqlite_connection.close()
+    @property
+    def _cache(self) -> Optional[ObjectCache]:
+        return self._shared.caches.get(self.table_name)
+    
+    def cache_stats(self) -> Optional[dict]:
+        ''' Returns the hit, miss and eviction counters of the cache. None if caching is off. '''
+
+        if self._cache is None:
+            return None
+        return self._cache.stats()
+    
+    @staticmethod
+    def connection_stats() -> dict:
+        ''' Returns how many connections were opened, reused and closed during the session. '''
+
+        return connection_registry.stats()
+    
+    @contextmanager
+    def transaction(self):
+        '''
+        Groups storage operations into one transaction with a single commit at the end.
+        Everything is rolled back if an exception is raised within the block.
+        Transactions can be nested, only the outermost one commits. Example:
+
+            with storage.transaction():
+                storage.delete('old-tag')
+                storage.store('new-tag', object_)
+        '''
+
+        self._shared.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._shared.transaction_depth -= 1
+            if not self._shared.transaction_depth:
+                self.sqlite_connection.rollback()
+                self._shared.pending_changes.clear()
+                # Objects read back within the transaction may be cached, of any table, and
+                # data_version doesn't change for this connection's own writes
+                for cache in self._shared.caches.values():
+                    cache.clear()
+                self._rolled_back()
+            raise
+        else:
+            self._shared.transaction_depth -= 1
+            self._commit()
+    
+    def _rolled_back(self) -> None:
+        ''' Override to forget what was kept about writes of a transaction that was rolled back. '''
+    
+    def _commit(self) -> None:
+        '''
+        Commits unless a transaction is in progress, which will commit when it ends.
+        Announces the committed changes to the listeners of the storages that made them.
+        '''
+
+        if not self._shared.transaction_depth:
+            self.sqlite_connection.commit()
+
+            changes = self._shared.pending_changes
+            self._shared.pending_changes = []
+            for storage, event, tag in changes:
+                for listener in storage._listeners:
+                    listener(event, tag)
+    
+    def add_listener(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        '''
+        Calls listener(event, tag) after each committed change made through this storage.
+        event is 'stored' (stored or replaced), 'deleted' or 'cleared' (tag is None then).
+        '''
+
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        self._listeners.remove(listener)
+    
+    def _changed(self, event: str, tag: Optional[str]) -> None:
+        ''' Records a change to announce on commit and drops the changed object from the cache. '''
+
+        if tag is None:
+            if self._cache is not None:
+                self._cache.clear()
+        else:
+            self._forget(tag)
+        if self._listeners:
+            self._shared.pending_changes.append((self, event, tag))
     
     @staticmethod
     def _scrub_table_name(table_name: str):
@@ -41,63 +470,693 @@ class ObjectStorage:
             return tag
     
     def create_table(self) -> None:
-        ''' Initializes the storage table. '''
+        ''' Initializes the storage table, adding columns missing from older tables. '''
 
         self.sqlite_cursor.execute('''CREATE TABLE IF NOT EXISTS {0} (
             id INTEGER PRIMARY KEY ASC,
             tag TEXT UNIQUE,
-            object BLOB
+            object BLOB,
+            version INTEGER NOT NULL DEFAULT 0
         )'''.format(self._scrub_table_name(self.table_name)))
 
+        existing_columns = [row[1] for row in self.sqlite_cursor.execute(
+            'PRAGMA table_info({0})'.format(self.table_name)).fetchall()]
+        if 'version' not in existing_columns:
+            self.sqlite_cursor.execute(
+                'ALTER TABLE {0} ADD COLUMN version INTEGER NOT NULL DEFAULT 0'.format(
+                    self.table_name))
+
+        if self.summary_columns:
+            for name, type_ in self.summary_columns:
+                if name not in existing_columns:
+                    self.sqlite_cursor.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+                        self.table_name, self._scrub_table_name(name),
+                        self._scrub_table_name(type_)))
+                self.sqlite_cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS {0}_{1}_idx ON {0} ({1})'.format(
+                        self.table_name, self._scrub_table_name(name)))
+            self._backfill_summaries()
+
+        if self.search_columns:
+            self.sqlite_cursor.execute(('CREATE VIRTUAL TABLE IF NOT EXISTS {0}_search USING fts5('
+                '{1}, tokenize=\'unicode61 remove_diacritics 2\', prefix=\'2 3\')').format(
+                    self.table_name,
+                    ', '.join(self._scrub_table_name(name) for name in self.search_columns)))
+            self._backfill_search()
+
+        self._shared.tables.add(self._table_key)
+    
+    def _backfill_summaries(self) -> None:
+        ''' Fills in the summary of objects stored before the summary columns existed. '''
+
+        first_column = self.summary_columns[0][0]
+        rows = self.sqlite_cursor.execute('SELECT id, object FROM {0} WHERE {1} IS NULL'.format(
+            self.table_name, first_column)).fetchall()
+        if not rows:
+            return
+        
+        def summaries():
+            for start in range(0, len(rows), SUMMARY_BATCH):
+                batch = rows[start:start + SUMMARY_BATCH]
+                yield from ((*summary, id_) for (id_, object_), summary in zip(batch,
+                    self.summarize_many([self.codec.decode(object_) for id_, object_ in batch])))
+
+        with self.transaction():
+            self.sqlite_cursor.executemany('UPDATE {0} SET {1} WHERE id=?'.format(
+                self.table_name,
+                ', '.join('{}=?'.format(name) for name, type_ in self.summary_columns)),
+                summaries())
+    
+    def _backfill_search(self) -> None:
+        ''' Adds objects stored before the full-text index existed to the index. '''
+
+        rows = self.sqlite_cursor.execute(
+            'SELECT tag, object FROM {0} WHERE id NOT IN (SELECT rowid FROM {0}_search)'.format(
+                self.table_name)).fetchall()
+        if not rows:
+            return
+        
+        with self.transaction():
+            self.sqlite_cursor.executemany(self._sql['index'],
+                ((*self.search_text(self.codec.decode(object_)), tag) for tag, object_ in rows))
+    
+    def search_text(self, object_: Any) -> tuple:
+        ''' Override to return the text of search_columns for an object, in the same order. '''
+
+        return ()
+    
+    def _index(self, tag: str, object_: Any) -> None:
+        ''' (Re)indexes the text of a stored object if full-text search is enabled. '''
+
+        if self.search_columns:
+            self.sqlite_cursor.execute(self._sql['unindex'], (tag, ))
+            self.sqlite_cursor.execute(self._sql['index'], (*self.search_text(object_), tag))
+    
+    def _unindex(self, tag: str) -> None:
+        ''' Removes an object from the full-text index. Call before deleting it. '''
+
+        if self.search_columns:
+            self.sqlite_cursor.execute(self._sql['unindex'], (tag, ))
+    
+    @staticmethod
+    def _match_query(text: str) -> str:
+        ''' Turns the words typed by the user into an FTS5 query matching all word prefixes. '''
+
+        return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in text.split())
+    
+    def summarize(self, object_: Any) -> tuple:
+        ''' Override to return the values of summary_columns for an object, in the same order. '''
+
+        return ()
+    
+    def summarize_many(self, objects: List[Any]) -> List[tuple]:
+        '''
+        Returns the summary of each of the objects, see summarize(). Override it if summarizing
+        many objects together is faster than one by one.
+        '''
+
+        return [self.summarize(object_) for object_ in objects]
+    
+    def _stored(self, tag: str, object_: Any) -> None:
+        ''' Override to keep other tables about the objects up to date. Called after every write. '''
+    
+    def copied_columns(self, overrides: dict) -> Optional[dict]:
+        '''
+        Override to return the values of the summary and search columns that overrides of a
+        copy change, by column name. None means they have to be made from the object again.
+        '''
+
+        return None if self.summary_columns or self.search_columns else {}
+    
+    def _copied(self, src_tag: str, dst_tag: str) -> None:
+        ''' Override to copy what other tables keep about an object along with it. '''
+    
+    def _record(self, tag: str, object_: Any, summary: Optional[tuple] = None) -> tuple:
+        '''
+        Returns the values of a row storing the object, as expected by store and upsert.
+        The summary of the object is made unless it's given.
+        '''
+
+        if summary is None:
+            summary = self.summarize(object_)
+        return (self._scrub_tag(tag), self.codec.encode(object_), *summary)
+
+    def _forget(self, tag: str) -> None:
+        ''' Drops an object from the cache after it's written through this connection. '''
+
+        if self._cache is not None:
+            self._cache.discard(tag)
+
+    def _cached(self, tag: str, data_version: int) -> Any:
+        '''
+        Returns the cached object of a tag, or _NOT_CACHED if it's not cached or has changed
+        since. Only checks the row version if another connection committed in the meantime.
+        '''
+
+        entry = self._cache.lookup(tag)
+        if entry is not None:
+            if entry[1] == data_version:
+                return entry[2]
+            row = self.sqlite_connection.execute(self._sql['version'], (tag, )).fetchone()
+            if row is not None and row[0] == entry[0]:
+                entry[1] = data_version
+                return entry[2]
+            self._cache.discard(tag)
+        return _NOT_CACHED
+
+    def _load(self, object_row: tuple, data_version: Optional[int]) -> Any:
+        ''' Decodes an (id, tag, object, version) row and caches the object if enabled. '''
+
+        object_ = self.codec.decode(object_row[2])
+        if data_version is not None:
+            self._cache.put(object_row[1], object_row[3], data_version, object_,
+                len(object_row[2]))
+        return object_
+
+    def _summaries(self, tagged_objects: List[Tuple[str, Any]]) -> List[tuple]:
+        if not self.summary_columns:
+            return [()] * len(tagged_objects)
+        return self.summarize_many([object_ for tag, object_ in tagged_objects])
+
     def store(self, tag: str, object_: Any) -> None:
         ''' Store one object in the sqlite table with a given tag. '''
 
         try:
-            self.sqlite_cursor.execute('''INSERT INTO {0} (tag, object) VALUES (?, ?)'''.format(
-                self._scrub_table_name(self.table_name)),
-                (self._scrub_tag(tag), pickle.dumps(object_, protocol=4)))
-            self.sqlite_connection.commit()
+            self.sqlite_cursor.execute(self._sql['store'], self._record(tag, object_))
+            self._index(tag, object_)
+            self._stored(tag, object_)
+            self._changed('stored', tag)
+            self._commit()
         except sqlite3.IntegrityError:
             print('Object with tag <{0}> exists in the database! Tags must be unique.'.format(tag))
             raise
     
+    def upsert(self, tag: str, object_: Any) -> None:
+        '''
+        Store one object with a given tag, replacing the object already stored with that tag.
+        Runs as a single statement with one commit, so the tag is never missing from storage.
+        '''
+
+        self.sqlite_cursor.execute(self._sql['upsert'], self._record(tag, object_))
+        self._index(tag, object_)
+        self._stored(tag, object_)
+        self._changed('stored', tag)
+        self._commit()
+    
+    def store_many(self, tagged_objects: Iterable[Tuple[str, Any]]) -> None:
+        ''' Store many (tag, object) pairs in one transaction. Tags must not exist yet. '''
+
+        tagged_objects = list(tagged_objects)
+        summaries = self._summaries(tagged_objects)
+        search_rows = []
+
+        def records():
+            for (tag, object_), summary in zip(tagged_objects, summaries):
+                self._changed('stored', tag)
+                if self.search_columns:
+                    search_rows.append((*self.search_text(object_), tag))
+                yield self._record(tag, object_, summary)
+
+        with self.transaction():
+            try:
+                self.sqlite_cursor.executemany(self._sql['store'], records())
+            except sqlite3.IntegrityError:
+                print('An object with one of the tags exists in the database! '
+                      'Tags must be unique.')
+                raise
+            if search_rows:
+                self.sqlite_cursor.executemany(self._sql['index'], search_rows)
+            for tag, object_ in tagged_objects:
+                self._stored(tag, object_)
+    
+    def upsert_many(self, tagged_objects: Iterable[Tuple[str, Any]]) -> None:
+        ''' Store many (tag, object) pairs in one transaction, replacing objects with the same tag. '''
+
+        tagged_objects = list(tagged_objects)
+        summaries = self._summaries(tagged_objects)
+        with self.transaction():
+            for (tag, object_), summary in zip(tagged_objects, summaries):
+                self.sqlite_cursor.execute(self._sql['upsert'],
+                    self._record(tag, object_, summary))
+                self._index(tag, object_)
+                self._stored(tag, object_)
+                self._changed('stored', tag)
+
+    def copy(self, src_tag: str, dst_tag: str, overrides: Optional[dict] = None) -> None:
+        '''
+        Stores a copy of the object of src_tag with the tag dst_tag. The row is copied within
+        sqlite, without decoding the object. For objects that are dicts, overrides replaces the
+        values of some keys in the copy, which the codec rewrites in the stored bytes. Only if
+        copied_columns() can't tell the summary and search columns of the changed copy is it
+        decoded and stored like a new object. Raises KeyError if src_tag isn't stored.
+        '''
+
+        with self.transaction():
+            self._copy(src_tag, dst_tag, overrides or {})
+    
+    def copy_many(self, copies: Iterable[Tuple[str, str, Optional[dict]]]) -> None:
+        ''' Makes many (source tag, copy tag, overrides) copies in one transaction, see copy(). '''
+
+        with self.transaction():
+            for src_tag, dst_tag, overrides in copies:
+                self._copy(src_tag, dst_tag, overrides or {})
+    
+    def _copy(self, src_tag: str, dst_tag: str, overrides: dict) -> None:
+        columns = self.copied_columns(overrides) if overrides else {}
+        parameters = [self._scrub_tag(dst_tag)]
+        if overrides:
+            row = self.sqlite_connection.execute(self._sql['object'], (src_tag, )).fetchone()
+            if row is None:
+                raise KeyError(src_tag)
+            if columns is None:
+                object_ = self.codec.decode(row[0])
+                object_.update(overrides)
+                self.store(dst_tag, object_)
+                return
+            parameters.append(self.codec.replace(row[0], overrides))
+
+        summary_values = [columns[name] for name, type_ in self.summary_columns if name in columns]
+        self.sqlite_cursor.execute(self._sql['copy'].format('?' if overrides else 'object',
+            ''.join(', ?' if name in columns else ', ' + name
+                for name, type_ in self.summary_columns)),
+            (*parameters, *summary_values, src_tag))
+        if not self.sqlite_cursor.rowcount:
+            raise KeyError(src_tag)
+        if self.search_columns:
+            self.sqlite_cursor.execute(self._sql['copy_index'].format(
+                ', '.join('?' if name in columns else name for name in self.search_columns)),
+                (dst_tag, *[columns[name] for name in self.search_columns if name in columns],
+                    src_tag))
+        self._copied(src_tag, dst_tag)
+        self._changed('stored', dst_tag)
+    
     def get(self, tag: str) -> Any:
         ''' Get one object from the sqlite table with a given tag. Return None if doesn't exist. '''
 
-        self.sqlite_cursor.execute('SELECT id, tag, object FROM {0} WHERE tag=?'.format(
-            self._scrub_table_name(self.table_name)), (tag, ))
+        data_version = None
+        if self._cache is not None:
+            data_version = self._shared.data_version()
+            object_ = self._cached(tag, data_version)
+            if object_ is not _NOT_CACHED:
+                self._cache.hits += 1
+                return object_
+            self._cache.misses += 1
+
+        self.sqlite_cursor.execute(self._sql['get'], (tag, ))
         
         object_ = self.sqlite_cursor.fetchone()
         if object_:
-            return pickle.loads(object_[2])
+            return self._load(object_, data_version)
         else:
             return None
     
     def get_all(self) -> dict:
         ''' Return all stored objects in a dict with their tags as keys. '''
 
-        self.sqlite_cursor.execute('SELECT id, tag, object FROM {0}'.format(
-            self._scrub_table_name(self.table_name)))
+        self.sqlite_cursor.execute(self._sql['get_all'])
         
         objects = dict()
 
         object_row = self.sqlite_cursor.fetchone()
         while object_row is not None:
-            objects[object_row[1]] = pickle.loads(object_row[2])
+            objects[object_row[1]] = self.codec.decode(object_row[2])
             object_row = self.sqlite_cursor.fetchone()
         
         return objects
     
+    def iter_all(self) -> Iterator[Tuple[str, LazyObject]]:
+        '''
+        Yield (tag, LazyObject) pairs of all stored objects, streaming them from the database.
+        Objects are decoded only when LazyObject.value is first accessed.
+        '''
+
+        for object_row in self.sqlite_connection.execute(self._sql['get_all']):
+            yield object_row[1], LazyObject(object_row[2], self.codec.decode)
+    
+    def tags(self, order_by: Optional[str] = None, descending: bool = False) -> list:
+        '''
+        Return the tags of all stored objects without reading the objects themselves.
+        They are sorted like get_summaries if order_by is given, unordered otherwise.
+        '''
+
+        if order_by is None and not descending:
+            return [row[0] for row in self.sqlite_connection.execute(self._sql['tags'])]
+        return [row[0] for row in self.sqlite_connection.execute(
+            self._sql['ordered_tags'].format(self._order(order_by, descending)))]
+    
+    def _order(self, order_by: Optional[str], descending: bool, table: str = '') -> str:
+        '''
+        Returns the ORDER BY terms sorting by a summary column, or in the order the objects were
+        stored if order_by is None. Ties are broken by that order too, so sorting by an indexed
+        summary column reads the index instead of sorting.
+        '''
+
+        if order_by is not None and order_by not in (name for name, type_ in self.summary_columns):
+            raise ValueError('Can only order by a summary column, not {!r}.'.format(order_by))
+        direction = ' DESC' if descending else ''
+        terms = ['{}{}{}'.format(table, order_by, direction)] if order_by is not None else []
+        terms.append('{}id{}'.format(table, direction))
+        return ', '.join(terms)
+    
+    def get_summaries(self, search: Optional[str] = None, order_by: Optional[str] = None,
+            descending: bool = False) -> list:
+        '''
+        Return (tag, *summary_columns) tuples of all stored objects without unpickling them.
+        If search is given, only objects matching every word (or word prefix) of it are returned.
+        They are sorted by the summary column order_by, or in the order they were stored.
+        '''
+
+        if search and self._match_query(search):
+            return self.sqlite_connection.execute(self._sql['search_summaries'].format(
+                self._order(order_by, descending, self.table_name + '.')),
+                (self._match_query(search), )).fetchall()
+        return self.sqlite_connection.execute(
+            self._sql['summaries'].format(self._order(order_by, descending))).fetchall()
+    
+    def get_summaries_page(self, limit: int, after: Optional[str] = None,
+            before: Optional[str] = None, search: Optional[str] = None,
+            order_by: Optional[str] = None, descending: bool = False) -> list:
+        '''
+        Return up to limit (tag, *summary_columns) tuples, in the order of get_summaries with the
+        same search, order_by and descending, that follow the object tagged after, or precede the
+        object tagged before. Without either the first page is returned.
+
+        Pages are found by keyset pagination: the sort key of the after (or before) object is
+        looked up and the index is read from there, so any page is as fast as the first one.
+        '''
+
+        forward = before is None
+        table = self.table_name + '.'
+        key_columns = [order_by, 'id'] if order_by is not None else ['id']
+        where = '1'
+        if after is not None or before is not None:
+            where = self._sql['after_key'].format(
+                ', '.join(table + column for column in key_columns),
+                '>' if forward != descending else '<',
+                ', '.join(key_columns))
+        order = self._order(order_by, descending if forward else not descending, table)
+
+        if search and self._match_query(search):
+            rows = self.sqlite_connection.execute(
+                self._sql['search_summaries_page'].format(where, order),
+                (self._match_query(search), *[tag for tag in (after, before) if tag is not None],
+                    limit)).fetchall()
+        else:
+            rows = self.sqlite_connection.execute(self._sql['summaries_page'].format(where, order),
+                (*[tag for tag in (after, before) if tag is not None], limit)).fetchall()
+        if not forward:
+            rows.reverse()
+        return rows
+    
+    def summary_position(self, tag: str, order_by: Optional[str] = None,
+            descending: bool = False) -> Optional[int]:
+        '''
+        Return the index of an object in get_summaries sorted the same way, without a search.
+        None if it doesn't exist. Counts along the index of order_by instead of sorting.
+        '''
+
+        if self.get_summary(tag) is None:
+            return None
+        order_column = order_by if order_by is not None else 'id'
+        return self.sqlite_connection.execute(
+            self._sql['position'].format(order_column, '>' if descending else '<'),
+            (tag, )).fetchone()[0]
+    
+    def get_summary(self, tag: str) -> Optional[tuple]:
+        ''' Return the (tag, *summary_columns) tuple of one object. None if it doesn't exist. '''
+
+        return self.sqlite_connection.execute(self._sql['summary'], (tag, )).fetchone()
+    
+    def search(self, text: str, limit: int = -1) -> list:
+        '''
+        Return the tags of objects matching every word (or word prefix) of text in their
+        search_columns, in the order they were stored. Ranking is skipped on purpose as it has to
+        score every match, while without it a limited search stops at the first matches.
+        '''
+
+        if not self._match_query(text):
+            return []
+        return [row[0] for row in self.sqlite_connection.execute(self._sql['search'],
+            (self._match_query(text), limit))]
+    
+    def get_many(self, tags: Iterable[str]) -> dict:
+        ''' Return the stored objects with the given tags in a dict. Missing tags are left out. '''
+
+        tags = list(tags)
+        objects = dict()
+
+        data_version = None
+        if self._cache is not None:
+            data_version = self._shared.data_version()
+            uncached_tags = []
+            for tag in tags:
+                object_ = self._cached(tag, data_version)
+                if object_ is _NOT_CACHED:
+                    self._cache.misses += 1
+                    uncached_tags.append(tag)
+                else:
+                    self._cache.hits += 1
+                    objects[tag] = object_
+            tags = uncached_tags
+
+        for offset in range(0, len(tags), MAX_QUERY_VARIABLES):
+            chunk = tags[offset:offset + MAX_QUERY_VARIABLES]
+            self.sqlite_cursor.execute(self._sql['get_many'].format(', '.join('?' * len(chunk))),
+                chunk)
+            for object_row in self.sqlite_cursor.fetchall():
+                objects[object_row[1]] = self._load(object_row, data_version)
+        
+        return objects
+    
     def delete(self, tag: str) -> None:
         ''' Delete one object from storage with the given tag. '''
 
-        self.sqlite_cursor.execute('DELETE FROM {0} WHERE tag=?'.format(
-            self._scrub_table_name(self.table_name)), (tag, ))
-        self.sqlite_connection.commit()
+        self._unindex(tag)
+        self.sqlite_cursor.execute(self._sql['delete'], (tag, ))
+        self._changed('deleted', tag)
+        self._commit()
+    
+    def delete_many(self, tags: Iterable[str]) -> None:
+        ''' Delete the objects with the given tags in one transaction. '''
+
+        def parameters():
+            for tag in tags:
+                self._changed('deleted', tag)
+                yield (tag, )
+
+        tags = list(tags)
+        with self.transaction():
+            if self.search_columns:
+                self.sqlite_cursor.executemany(self._sql['unindex'], ((tag, ) for tag in tags))
+            self.sqlite_cursor.executemany(self._sql['delete'], parameters())
     
     def delete_all(self) -> None:
         ''' Purge storage of all objects. '''
 
         self.sqlite_cursor.execute('DROP TABLE IF EXISTS {0}'.format(
             self._scrub_table_name(self.table_name)))
+        self.sqlite_cursor.execute('DROP TABLE IF EXISTS {0}_search'.format(
+            self._scrub_table_name(self.table_name)))
+        self._shared.tables -= {key for key in self._shared.tables if key[0] == self.table_name}
+        self._changed('cleared', None)
         self.create_table()
+        self._commit()
+
+
+class LatencyHistogram:
+    ''' Counts latencies into buckets (upper bounds in milliseconds) and keeps simple totals. '''
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(self.BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS_MS, milliseconds)] += 1
+            self.count += 1
+            self.total_ms += milliseconds
+            self.max_ms = max(self.max_ms, milliseconds)
+
+    def percentile(self, percent: float) -> float:
+        ''' Returns the upper bound of the bucket the given percentile of latencies falls in. '''
+
+        with self._lock:
+            threshold = self.count * percent / 100
+            seen = 0
+            for bucket_ms, count in zip(self.BUCKETS_MS, self.counts):
+                seen += count
+                if count and seen >= threshold:
+                    return bucket_ms
+            return 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'count': self.count,
+                'mean_ms': self.total_ms / self.count if self.count else 0.0,
+                'max_ms': self.max_ms,
+                'buckets': {'<={}'.format(bucket_ms): count
+                    for bucket_ms, count in zip(self.BUCKETS_MS, self.counts)},
+            }
+
+
+class AsyncObjectStorage:
+    '''
+    Runs the writes of an ObjectStorage (or subclass) on a single background thread with its own
+    connection, so the Tk main thread never waits for a commit or a locked database.
+    Writes are queued and return a concurrent.futures.Future. A callback given with the write
+    is called with the future on the thread of the widget passed to deliver_to(), polled with
+    Tk's after(), and so are change listeners. Queue to done latencies are collected in latency.
+    Call close() (or AsyncObjectStorage.close_all() on exit) to finish the queued writes.
+    '''
+
+    POLL_INTERVAL = 20  # ms between checks for completed writes while some are pending
+
+    _instances = []
+
+    def __init__(self, storage_class: type, sqlite_db_path: str, table_name: str,
+            **storage_kwargs):
+        self.sqlite_db_path = sqlite_db_path
+        self.table_name = table_name
+        self.latency = LatencyHistogram()
+
+        self._storage_args = (storage_class, sqlite_db_path, table_name, storage_kwargs)
+        self._requests = queue.Queue()
+        self._completions = queue.Queue()
+        self._pending = 0  # writes whose callbacks haven't been delivered yet
+        self._listeners = []
+        self._widget = None
+        self._after_id = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True,
+            name='AsyncObjectStorage {}:{}'.format(sqlite_db_path, table_name))
+        self._thread.start()
+        AsyncObjectStorage._instances.append(self)
+
+    def _run(self) -> None:
+        storage_class, sqlite_db_path, table_name, storage_kwargs = self._storage_args
+        storage = storage_class(sqlite_db_path, table_name, **storage_kwargs)
+        storage.add_listener(lambda event, tag: self._completions.put((None, (event, tag))))
+
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            future, method_name, args, callback, queued_at = request
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(getattr(storage, method_name)(*args))
+                except BaseException as exception:
+                    future.set_exception(exception)
+            self.latency.add(time.perf_counter() - queued_at)
+            self._completions.put((future, callback))
+
+        connection_registry.close(sqlite_db_path)
+
+    def submit(self, method_name: str, *args, callback: Optional[Callable] = None) -> Future:
+        ''' Queues a call of the storage's method. Returns a future of its result. '''
+
+        if not self._thread.is_alive():
+            raise RuntimeError('AsyncObjectStorage is closed.')
+
+        future = Future()
+        self._pending += 1
+        self._requests.put((future, method_name, args, callback, time.perf_counter()))
+        self._schedule_poll()
+        return future
+
+    def store(self, tag: str, object_: Any, callback: Optional[Callable] = None) -> Future:
+        return self.submit('store', tag, object_, callback=callback)
+
+    def upsert(self, tag: str, object_: Any, callback: Optional[Callable] = None) -> Future:
+        return self.submit('upsert', tag, object_, callback=callback)
+
+    def store_many(self, tagged_objects: Iterable[Tuple[str, Any]],
+            callback: Optional[Callable] = None) -> Future:
+        return self.submit('store_many', list(tagged_objects), callback=callback)
+
+    def upsert_many(self, tagged_objects: Iterable[Tuple[str, Any]],
+            callback: Optional[Callable] = None) -> Future:
+        return self.submit('upsert_many', list(tagged_objects), callback=callback)
+
+    def copy(self, src_tag: str, dst_tag: str, overrides: Optional[dict] = None,
+            callback: Optional[Callable] = None) -> Future:
+        return self.submit('copy', src_tag, dst_tag, overrides, callback=callback)
+
+    def copy_many(self, copies: Iterable[Tuple[str, str, Optional[dict]]],
+            callback: Optional[Callable] = None) -> Future:
+        return self.submit('copy_many', list(copies), callback=callback)
+
+    def delete(self, tag: str, callback: Optional[Callable] = None) -> Future:
+        return self.submit('delete', tag, callback=callback)
+
+    def delete_many(self, tags: Iterable[str], callback: Optional[Callable] = None) -> Future:
+        return self.submit('delete_many', list(tags), callback=callback)
+
+    def add_listener(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        '''
+        Calls listener(event, tag) for each change committed by the writer (see
+        ObjectStorage.add_listener). Listeners are called on the Tk main thread, before the
+        callback of the write that made the change.
+        '''
+
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        self._listeners.remove(listener)
+
+    def deliver_to(self, widget) -> None:
+        ''' Sets the Tk widget whose after() delivers the callbacks on the Tk main thread. '''
+
+        self._widget = widget
+        self._schedule_poll()
+
+    def _schedule_poll(self) -> None:
+        if self._widget is not None and self._after_id is None and self._pending:
+            self._after_id = self._widget.after(self.POLL_INTERVAL, self.poll)
+
+    def poll(self) -> None:
+        ''' Calls the callbacks of completed writes. Scheduled by itself while writes pending. '''
+
+        self._after_id = None
+        while True:
+            try:
+                future, callback = self._completions.get_nowait()
+            except queue.Empty:
+                break
+            if future is None:  # a change announced by the storage, callback is (event, tag)
+                for listener in self._listeners:
+                    self._deliver(listener, *callback)
+                continue
+            self._pending -= 1
+            if callback is not None:
+                self._deliver(callback, future)
+        self._schedule_poll()
+
+    def _deliver(self, callback: Callable, *args) -> None:
+        # A failing callback mustn't hold back the others, Tk reports its error as usual
+        try:
+            callback(*args)
+        except Exception:
+            self._widget._root().report_callback_exception(*sys.exc_info())
+
+    def close(self) -> None:
+        ''' Waits for the queued writes to finish, then stops the writer thread. '''
+
+        if self._thread.is_alive():
+            self._requests.put(None)
+            self._thread.join()
+        if self in AsyncObjectStorage._instances:
+            AsyncObjectStorage._instances.remove(self)
+
+    @classmethod
+    def close_all(cls) -> None:
+        for instance in list(cls._instances):
+            instance.close()
@@ -0,0 +1,39 @@
+import fludo
+
+import library_io
+from storage import AsyncObjectStorage, connection_registry
+from mixture_storage import MixtureStorage
+
+
+def mixture(name):
+    return {
+        'ingredients': [fludo.Liquid(name='Base', ml=90, pg=50, vg=50),
+                        fludo.Liquid(name='Nic', ml=10, pg=50, vg=50, nic=20)],
+        'bottle_vol': 100,
+        'filler_idx': 0,
+        'name': name,
+        'notes': '',
+    }
+
+
+def test_save_during_export(tmp_path):
+    db_file = str(tmp_path / 'library.db')
+    storage = MixtureStorage(db_file, 'mixtures')
+    storage.store_many(('m{}'.format(idx), mixture('Mixture {}'.format(idx)))
+        for idx in range(3 * library_io.PROGRESS_EVERY))
+    writer = AsyncObjectStorage(MixtureStorage, db_file, 'mixtures')
+    saved = []
+
+    def save(count):
+        # Called while the export's read of the library is still open
+        if not saved:
+            saved.append(writer.upsert('m0', mixture('Saved')).result(timeout=10))
+
+    try:
+        library_io.export_library(storage, str(tmp_path / 'library.jsonl'), progress=save)
+    finally:
+        writer.close()
+        connection_registry.close(db_file)
+    assert saved == [None]
+    assert MixtureStorage(db_file, 'mixtures').get('m0')['name'] == 'Saved'
+    connection_registry.close(db_file)
@@ -0,0 +1,33 @@
+import random
+
+import fludo
+
+from mixture_batch import MixtureBatch
+
+
+def random_liquid(rng):
+    pg = rng.choice([0, 30, 50, 70, 100, rng.uniform(0, 100)])
+    return fludo.Liquid(rng.choice([0, 0.1, rng.randint(1, 100), rng.uniform(0, 100)]),
+        nic=rng.choice([0, 3, 20, rng.uniform(0, 72)]), name='Liquid',
+        cost_per_ml=rng.choice([0, rng.uniform(0, 2)]), pg=pg, vg=100 - pg)
+
+
+def test_rows_match_fludo():
+    rng = random.Random(24)
+    mixtures = [[], [fludo.Liquid(0, pg=100, vg=0)]]
+    mixtures += [[random_liquid(rng) for _ in range(rng.randint(0, 12))] for _ in range(2000)]
+
+    rows = MixtureBatch(mixtures).rows()
+    assert len(rows) == len(mixtures)
+    for liquids, row in zip(mixtures, rows):
+        mixture = fludo.Mixture(*liquids)
+        # Exactly the same floats, not just close ones
+        assert row == (mixture.ml, mixture.pg, mixture.vg, mixture.nic, mixture.get_cost())
+
+
+def test_of_dicts():
+    liquids = [fludo.Liquid(30, pg=50, vg=50, nic=20), fludo.Liquid(70, pg=30, vg=70)]
+    mixture = fludo.Mixture(*liquids)
+    rows = MixtureBatch.of_dicts([{'ingredients': liquids}, {'ingredients': []}]).rows()
+    assert rows == [(mixture.ml, mixture.pg, mixture.vg, mixture.nic, mixture.get_cost()),
+        (0.0, 50.0, 50.0, 0.0, 0.0)]
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import fludo
+
+from mixture_model import MixtureModel
+
+
+def model_of(*volumes, filler_idx=None, bottle_vol=100):
+    model = MixtureModel(bottle_vol)
+    model.load([fludo.Liquid(ml, name='Liquid {}'.format(idx), pg=50, vg=50)
+        for idx, ml in enumerate(volumes)], bottle_vol, filler_idx)
+    return model
+
+
+def assert_matches_fludo(model):
+    mixture = model.mixture()
+    assert model.ml == pytest.approx(mixture.ml, abs=1e-12)
+    for name in ('pg', 'vg', 'nic'):
+        assert getattr(model, name) == pytest.approx(getattr(mixture, name), abs=1e-12)
+    assert model.cost == pytest.approx(mixture.get_cost(), abs=1e-12)
+
+
+def test_add_and_remove_shift_the_filler():
+    model = model_of(10, 0, 5, filler_idx=1)
+    assert model.filler_ml == 85
+    assert model.add(fludo.Liquid(20)) == 3
+    assert model.filler_ml == 65
+
+    model.remove(0)
+    assert model.filler_idx == 0
+    assert model.filler_ml == 75
+    model.remove(1)
+    assert model.filler_idx == 0
+    model.remove(0)
+    assert model.filler_idx is None
+    assert model.ml == 20
+
+
+def test_set_ml_of_the_filler_is_ignored():
+    model = model_of(10, 0, filler_idx=1)
+    model.set_ml(1, 50)
+    assert model.liquids[1].ml == 90
+    model.set_ml(0, 30)
+    assert model.liquids[1].ml == 70
+    assert model.ml == 100
+
+
+def test_set_bottle_volume_scales_the_ingredients():
+    model = model_of(10, 20, 0, filler_idx=2)
+    model.set_bottle_volume(50)
+    assert [liquid.ml for liquid in model.liquids] == [5, 10, 35]
+    assert not model.full
+    assert model.max_ml(0) == 40
+
+
+def test_refill_rounds_down_to_a_tenth():
+    model = model_of(33.33, 0, filler_idx=1)
+    assert model.liquids[1].ml == 66.6
+    model.set_ml(0, 99.99)
+    assert model.liquids[1].ml == 0
+    assert model.full
+
+
+def test_totals_match_fludo_after_random_edits():
+    rng = random.Random(20)
+    model = MixtureModel(100)
+    for idx in range(5):
+        pg = rng.uniform(0, 100)
+        model.add(fludo.Liquid(rng.uniform(0, 10), nic=rng.choice([0, 20]),
+            cost_per_ml=rng.uniform(0, 1), pg=pg, vg=100 - pg))
+    model.set_filler(4)
+
+    for edit in range(5000):
+        idx = rng.randrange(len(model))
+        model.set_ml(idx, round(rng.uniform(0, model.max_ml(idx)), 1))
+        if not edit % 500:
+            model.set_bottle_volume(rng.choice([10, 30, 100]))
+        assert_matches_fludo(model)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import fludo
+
+from mixture_solver import nnls, solve_mixture
+
+
+def liquids():
+    return [fludo.Liquid(name='PG', pg=100, vg=0),
+            fludo.Liquid(name='VG', pg=0, vg=100),
+            fludo.Liquid(name='Nic Shot', pg=50, vg=50, nic=20)]
+
+
+def test_nnls():
+    a = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+    assert nnls(a, np.array([1.0, 2.0, 3.0])) == pytest.approx([1.0, 2.0])
+    # The unconstrained solution has a negative x[1]
+    assert nnls(a, np.array([2.0, -2.0, 0.0])) == pytest.approx([1.0, 0.0])
+
+
+def test_reachable_profile():
+    solved = solve_mixture(liquids(), 100, 60, 40, 3)
+    assert solved.volumes == pytest.approx([52.5, 32.5, 15.0])
+    assert (solved.ml, solved.pg, solved.vg, solved.nic) == pytest.approx((100, 60, 40, 3))
+
+
+def test_fixed_volumes():
+    aroma = fludo.Liquid(name='Aroma', pg=100, vg=0)
+    solved = solve_mixture(liquids() + [aroma], 100, 60, 40, 3, fixed={3: 10})
+    assert solved.volumes == pytest.approx([42.5, 32.5, 15.0, 10.0])
+    assert (solved.pg, solved.nic) == pytest.approx((60, 3))
+
+
+def test_filler():
+    solved = solve_mixture(liquids(), 30, 50, 50, 6, filler_idx=1)
+    assert sum(solved.volumes) == pytest.approx(30)
+    assert solved.volumes[2] == pytest.approx(9.0)
+    assert (solved.pg, solved.vg, solved.nic) == pytest.approx((50, 50, 6))
+
+
+def test_unreachable_nicotine():
+    # Without a nicotine shot the closest mixture has no nicotine, but still the ratio
+    solved = solve_mixture(liquids()[:2], 100, 70, 30, 6)
+    assert solved.volumes == pytest.approx([70.0, 30.0])
+    assert (solved.ml, solved.pg, solved.nic) == pytest.approx((100, 70, 0))
+
+
+def test_fixed_volumes_exceeding_the_bottle():
+    with pytest.raises(ValueError):
+        solve_mixture(liquids(), 10, 50, 50, 0, fixed={0: 8, 2: 5})
+
+
+def test_no_liquids():
+    solved = solve_mixture([], 100, 50, 50, 0)
+    assert solved.volumes == []
+    assert (solved.ml, solved.pg, solved.vg, solved.nic) == (0.0, 50.0, 50.0, 0.0)
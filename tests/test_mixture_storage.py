@@ -0,0 +1,30 @@
+import fludo
+
+from storage import ObjectStorage, connection_registry
+from mixture_storage import MixtureCodec, MixtureStorage
+
+
+def test_unencodable_mixtures_are_converted_once(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'library.db')
+    # A pickled mixture from before the catalog, with a key the codec can't store
+    ObjectStorage(db_file, 'mixtures').store('legacy', {
+        'ingredients': [fludo.Liquid(name='Base', ml=10, pg=50, vg=50)],
+        'bottle_vol': 10,
+        'filler_idx': None,
+        'name': 'Legacy',
+        'notes': '',
+        'rating': 5,
+    })
+    connection_registry.close(db_file)
+    MixtureStorage(db_file, 'mixtures')
+    connection_registry.close(db_file)
+
+    decoded = []
+    decode = MixtureCodec.decode
+    monkeypatch.setattr(MixtureCodec, 'decode',
+        lambda codec, data: decoded.append(data) or decode(codec, data))
+    storage = MixtureStorage(db_file, 'mixtures')
+    assert decoded == []
+    assert storage.get('legacy')['rating'] == 5
+    assert storage.tags_using('Base') == []
+    connection_registry.close(db_file)
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from storage import AsyncObjectStorage, ObjectStorage, connection_registry
+
+
+def test_rollback_drops_cached_objects(tmp_path):
+    db_file = str(tmp_path / 'objects.db')
+    storage = ObjectStorage(db_file, 't', cache_items=100)
+    storage.store('a', {'v': 1})
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.upsert('a', {'v': 2})
+            assert storage.get('a') == {'v': 2}
+            raise RuntimeError()
+    assert storage.get('a') == {'v': 1}
+    connection_registry.close(db_file)
+
+
+class Widget:
+    ''' Stands in for the Tk widget of AsyncObjectStorage.deliver_to. '''
+
+    def __init__(self):
+        self.errors = []
+
+    def after(self, ms, function):
+        return 'after'
+
+    def _root(self):
+        return self
+
+    def report_callback_exception(self, exc_type, exc_value, exc_traceback):
+        self.errors.append(exc_value)
+
+
+def test_failing_callback_doesnt_stop_delivery(tmp_path):
+    db_file = str(tmp_path / 'objects.db')
+    storage = AsyncObjectStorage(ObjectStorage, db_file, 't')
+    widget = Widget()
+    storage.deliver_to(widget)
+    delivered = []
+
+    def fail(future):
+        raise RuntimeError('callback failed')
+
+    storage.store('a', 1, callback=fail)
+    storage.store('b', 2, callback=delivered.append).result(timeout=10)
+    storage.close()
+    storage.poll()
+    assert len(delivered) == 1
+    assert [str(error) for error in widget.errors] == ['callback failed']
+
+
+def test_close_all_leaves_other_threads_connections(tmp_path):
+    db_file = str(tmp_path / 'objects.db')
+    ObjectStorage(db_file, 't')
+    stats = connection_registry.stats()
+    worker = threading.Thread(target=ObjectStorage, args=(db_file, 't'))
+    worker.start()
+    worker.join()
+
+    connection_registry.close_all()
+    assert connection_registry.stats()['closes'] == stats['closes'] + 1
+    assert connection_registry.stats()['open'] == stats['open']
@@ -2,9 +2,11 @@ import tkinter as tk
 from tkinter import ttk
 
 import platform
-from typing import List
+from typing import List, Union
 
-from fludo import Liquid, Mixture
+from fludo import Liquid
+
+from mixture_snapshot import IngredientSnapshot, as_mixture
 
 from images import icons, graphics
 from common import round_digits
@@ -89,9 +91,9 @@ class BottleViewer:
         self.bottle_size = volume
         self.redraw()
     
-    def set_ingredients(self, ingredients: List[Liquid] = []):
-        self.ingredients = ingredients
-        self.ingredients.sort(key=lambda liquid: liquid.ml, reverse=False)
+    def set_ingredients(self, ingredients: List[Union[Liquid, IngredientSnapshot]] = []):
+        # Sorted into a list of its own, the ingredients are shown as they are, not copied
+        self.ingredients = sorted(ingredients, key=lambda liquid: liquid.ml)
         self.redraw()
     
     def redraw(self):
@@ -175,7 +177,7 @@ class BottleViewer:
             text='{} ml bottle'.format(self.bottle_size))
         
         # Draw mixture properties
-        mixture = Mixture(*self.ingredients)
+        mixture = as_mixture(self.ingredients)
         self.canvas.create_text((106, 180), font=('Calibri', 12, 'bold'), anchor=tk.N,
             justify=tk.CENTER, text='{} ml'.format(round_digits(mixture.ml, 1)))
         self.canvas.create_text((87, 218), font=('Calibri', 12, 'bold'), anchor=tk.N,